@@ -0,0 +1,182 @@
+import asyncio
+import json
+import math
+import os
+import time
+
+from context_window import estimate_tokens
+from retry_policy import backoff_delay, is_retryable, retry_after
+
+# Attempts per prompt on top of the engine's own request retries
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute (single event loop)."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def debit(self, amount):
+        """Charges tokens after the fact (e.g. output tokens); may drive the bucket negative."""
+        self._refill()
+        self.tokens -= amount
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def read_prompts(path):
+    """
+    Yields (id, prompt) from a JSONL file. Each line needs an id ("id" or "request_id")
+    and a prompt ("prompt", "text" or "body"; a "title" is prepended when present).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            item_id = record.get("id", record.get("request_id", line_number))
+            prompt = record.get("prompt") or record.get("text") or record.get("body") or ""
+            if record.get("title"):
+                prompt = f"{record['title']}\n\n{prompt}"
+            yield str(item_id), prompt
+
+
+class BatchRunner:
+    """
+    Runs independent single-turn prompts from a JSONL file through a GeminiChat's
+    ChatEngine, one engine session per prompt.
+
+    Up to `concurrency` requests are in flight at once under optional
+    requests-per-minute and tokens-per-minute buckets. The engine should make
+    a single attempt per request (RetryPolicy(max_attempts=1)) so that every
+    upstream request is charged to the buckets: retryable errors (429/5xx,
+    dropped connections, open circuits) are retried here, after Retry-After
+    or a jittered backoff, and each attempt acquires from the buckets again.
+    Results are appended to `out_path` in completion order and finished ids
+    go to a checkpoint file, so an interrupted run can be resumed by running
+    the same command again.
+    """
+
+    def __init__(self, chat, out_path, concurrency=4, rpm=None, tpm=None, checkpoint_path=None):
+        self.engine = chat.engine
+        self.out_path = out_path
+        self.checkpoint_path = checkpoint_path or out_path + ".done"
+        self.concurrency = max(1, concurrency)
+        self.requests_bucket = TokenBucket(rpm) if rpm else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm else None
+
+    async def run(self, input_path):
+        done = self._load_checkpoint()
+        pending = [(item_id, prompt) for item_id, prompt in read_prompts(input_path) if item_id not in done]
+        print(f"Batch: {len(pending)} prompts to run ({len(done)} already completed), concurrency {self.concurrency}")
+
+        latencies = []
+        failures = 0
+        # The position keeps engine sessions apart when an input file repeats an id
+        queue = iter(enumerate(pending))
+        started = time.perf_counter()
+        with open(self.out_path, "a", encoding="utf-8") as out, \
+                open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+
+            async def worker():
+                nonlocal failures
+                # Workers pull from a shared iterator; results are written as each one completes
+                for index, (item_id, prompt) in queue:
+                    result = await self._run_one(index, item_id, prompt)
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in result:
+                        failures += 1
+                    else:
+                        latencies.append(result["latency_s"])
+                        checkpoint.write(result["id"] + "\n")
+                        checkpoint.flush()
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+        self._print_summary(len(pending), failures, latencies, time.perf_counter() - started)
+
+    async def _run_one(self, index, item_id, prompt):
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.requests_bucket:
+                await self.requests_bucket.acquire()
+            if self.tokens_bucket:
+                await self.tokens_bucket.acquire(prompt_tokens)
+
+            request_started = time.perf_counter()
+            session = self.engine.session(f"batch:{index}:{item_id}")
+            try:
+                text = ""
+                async for event in self.engine.stream_turn(prompt, session_id=session.session_id):
+                    if event.kind == "done":
+                        text = event.data
+            except Exception as e:
+                if is_retryable(e) and attempt < MAX_ATTEMPTS:
+                    delay = retry_after(e)
+                    if delay is None:
+                        delay = backoff_delay(attempt, BACKOFF_BASE_SECONDS, BACKOFF_MAX_SECONDS)
+                    await asyncio.sleep(delay)
+                    continue
+                return {"id": item_id, "error": str(e), "attempts": attempt}
+            finally:
+                await self.engine.close_session(session.session_id)
+
+            latency = time.perf_counter() - request_started
+            usage = session.last_usage
+            total_tokens = getattr(usage, "total_token_count", None) or 0
+            if self.tokens_bucket and total_tokens > prompt_tokens:
+                self.tokens_bucket.debit(total_tokens - prompt_tokens)
+            return {
+                "id": item_id,
+                "response": text,
+                "latency_s": round(latency, 4),
+                "attempts": attempt,
+                "total_tokens": total_tokens,
+            }
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+
+    def _print_summary(self, total, failures, latencies, elapsed):
+        latencies.sort()
+        print("\n--- Batch Summary ---")
+        print(f"Completed: {total - failures}/{total}  Failed: {failures}")
+        print(f"Elapsed: {elapsed:.2f}s  Throughput: {(total - failures) / elapsed if elapsed else 0:.2f} req/s")
+        print(
+            f"Latency p50: {percentile(latencies, 50):.3f}s  "
+            f"p95: {percentile(latencies, 95):.3f}s  p99: {percentile(latencies, 99):.3f}s"
+        )
+        print(f"Results: {self.out_path}")
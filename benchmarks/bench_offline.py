@@ -0,0 +1,508 @@
+"""
+Offline end-to-end benchmarks against a local fake Gemini (no API key or network).
+
+Scenarios:
+  cli_long_history    CLI GeminiChat turns on top of a long history with a context budget
+  cli_large_response  CLI GeminiChat turns streaming very large answers
+  gui_text_turns      GUI process_api_call, headless, with a long journaled history
+  gui_image_turns     GUI image path: function call, parallel generate_images, downloads, gallery thumbnails
+  cli_flaky_stream    CLI turns with injected 503s and mid-stream disconnects (retry and resume)
+  batch_concurrent    CLI batch mode with concurrency and injected 503s
+
+Usage:
+    python benchmarks/bench_offline.py [--scenario NAME ...] [--turns 20] [--out results.json]
+    python benchmarks/bench_offline.py --out new.json --compare old.json
+
+Results are written as JSON (one object per scenario, plus the git commit) so
+runs from different commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_runner
+import gemini_chat_cli_legacy
+import gui_chat
+from chat_engine import ChatEngine, EngineLoop, MODEL_FLASH, build_config, text_message
+from chat_journal import MAX_TURNS, ChatJournal, journal_path_for
+from image_cache import ImageCache
+from model_router import build_router
+from stream_buffer import StreamBuffer
+from turn_metrics import MetricsRegistry
+from workers import PoolMetrics, WorkerPool, pooled_session
+
+from fake_gemini import FakeGeminiClient, FakeImageServer, FakeProfile, full_response
+
+HISTORY_TURNS = 2000
+HISTORY_MESSAGE_CHARS = 400
+CONTEXT_BUDGET_TOKENS = 8000
+IMAGES_PER_TURN = 6
+
+
+class NullWriter:
+    """stdout sink that only counts characters."""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text):
+        self.chars += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class NullWidget:
+    """Accepts any Tk widget call (configure, grid, focus_set, ...) and does nothing."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class HeadlessTranscript:
+    """Replaces TranscriptWindow; counts what would have been rendered."""
+
+    def __init__(self):
+        self.blocks = 0
+        self.rendered_chars = 0
+
+    def add_block(self, tag, label, text):
+        self.blocks += 1
+        self.rendered_chars += len(text)
+
+    def start_block(self, tag, label):
+        self.blocks += 1
+
+    def stream(self, text):
+        self.rendered_chars += len(text)
+
+    def finish_block(self, text=None):
+        pass
+
+
+class HeadlessTk:
+    """
+    Stands in for the Tk root: after() callbacks run in due-time order on a
+    single "UI" thread, and the time spent in them is accounted.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = []
+        self._ids = itertools.count(1)
+        self._cancelled = set()
+        self._running = True
+        self.ui_seconds = 0.0
+        self.callbacks = 0
+        self.thread = threading.Thread(target=self._run, name="headless-tk", daemon=True)
+        self.thread.start()
+
+    def after(self, ms, fn, *args):
+        with self._cond:
+            after_id = next(self._ids)
+            heapq.heappush(self._queue, (time.monotonic() + ms / 1000.0, after_id, fn, args))
+            self._cond.notify()
+            return after_id
+
+    def after_cancel(self, after_id):
+        with self._cond:
+            self._cancelled.add(after_id)
+
+    def sync(self, timeout=60):
+        """Waits until every callback scheduled so far (with no delay) has run."""
+        done = threading.Event()
+        self.after(0, done.set)
+        if not done.wait(timeout):
+            raise TimeoutError("UI thread did not drain")
+
+    def destroy(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self.thread.join(2)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if not self._running:
+                    return
+                _, after_id, fn, args = heapq.heappop(self._queue)
+                if after_id in self._cancelled:
+                    self._cancelled.discard(after_id)
+                    continue
+            started = time.perf_counter()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"UI callback failed: {e}", file=sys.__stderr__)
+            self.ui_seconds += time.perf_counter() - started
+            self.callbacks += 1
+
+
+class TrackingWorkerPool(WorkerPool):
+    """WorkerPool that remembers its futures so a turn can wait for its background jobs."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = super().submit(fn, *args)
+        self.futures.append(future)
+        return future
+
+    def wait(self, timeout=120):
+        while self.futures:
+            self.futures.pop(0).result(timeout)
+
+
+class HeadlessGui(gui_chat.GeminiChat):
+    """
+    gui_chat.GeminiChat without Tk: the same engine, journal, image cache and
+    worker pool as __init__ sets up, with widgets replaced by null objects and
+    the root replaced by HeadlessTk. process_api_call and the streaming/image
+    methods run unchanged.
+    """
+
+    def __init__(self, client, workdir, max_context_tokens=None, image_count=1):
+        self.master = HeadlessTk()
+        self._image_slots = itertools.count(1)
+        self.image_references = []
+        self.stream_buffer = StreamBuffer()
+        self._stream_tick_id = None
+
+        self.args = argparse.Namespace(
+            model=MODEL_FLASH, temperature=0.5, system=None, file=None,
+            max_context_tokens=max_context_tokens, cache='off', context_cache=False, metrics_out=None,
+            slo=None, hedge_after=None, route_log=None, max_history_turns=MAX_TURNS
+        )
+        self.model_name = MODEL_FLASH
+        self.config = build_config(self.args.temperature)
+        self.history_file = os.path.join(workdir, gui_chat.LOG_FILE_NAME)
+        self.journal = ChatJournal(journal_path_for(self.history_file), max_turns=self.args.max_history_turns)
+        self.search = None
+        started = time.perf_counter()
+        self.history = self._load_history()
+        self.load_seconds = time.perf_counter() - started
+        self.image_cache = ImageCache(os.path.join(workdir, "image_cache"))
+
+        self.pool_metrics = PoolMetrics()
+        self.workers = TrackingWorkerPool(metrics=self.pool_metrics)
+        self.http = pooled_session(self.pool_metrics)
+
+        self.client = client
+        self.response_cache = None
+        self.metrics = MetricsRegistry()
+        self.router = build_router(self.model_name, self.args)
+        self.engine = ChatEngine(
+            self.client, self.model_name, self.config, max_context_tokens, metrics=self.metrics,
+            image_count=image_count
+        )
+        self.session = self.engine.session(self.history_file, history=self.history)
+        self.engine_loop = EngineLoop()
+        self._turn_future = None
+        # Everything the warm-up thread would load is already in place
+        self._ready = threading.Event()
+        self._ready.set()
+
+        for name in ("logo_label", "chat_display", "gallery",
+                     "input_field", "send_button", "stop_button", "footer_label"):
+            setattr(self, name, NullWidget())
+        self.transcript = HeadlessTranscript()
+        self.images_shown = 0
+
+    def _show_gallery_image(self, slot_id, ctk_image, key):
+        self.images_shown += 1
+        super()._show_gallery_image(slot_id, ctk_image, key)
+
+    def run_turn(self, prompt, timeout=300):
+        """Sends one prompt like send_message_thread and waits until the UI is idle again."""
+        self.master.after(0, self.append_to_chat, "User", prompt)
+        self.engine_loop.submit(self.process_api_call(prompt)).result(timeout)
+        self.workers.wait(timeout)
+        self.master.sync(timeout)
+
+    def close(self):
+        self.shutdown()
+        self.master.destroy()
+
+
+# --- HELPERS ---
+
+@contextlib.contextmanager
+def patched(target, name, value):
+    original = getattr(target, name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def long_history(turns):
+    filler = ("history " * (HISTORY_MESSAGE_CHARS // 8 + 1))[:HISTORY_MESSAGE_CHARS]
+    messages = []
+    for i in range(turns):
+        messages.append(text_message("user", f"question {i}: {filler}"))
+        messages.append(text_message("model", f"answer {i}: {filler}"))
+    return messages
+
+
+def make_cli(client, argv=()):
+    """Builds gemini_chat_cli_legacy.GeminiChat with `client` in place of genai.Client()."""
+    with patched(gemini_chat_cli_legacy.genai, "Client", lambda *args, **kwargs: client), \
+            patched(sys, "argv", ["gemini_chat_cli_legacy.py", *argv]), \
+            contextlib.redirect_stdout(NullWriter()):
+        return gemini_chat_cli_legacy.GeminiChat()
+
+
+def run_cli_turns(chat, prompts):
+    loop = asyncio.new_event_loop()
+    sink = NullWriter()
+    try:
+        with contextlib.redirect_stdout(sink):
+            for prompt in prompts:
+                loop.run_until_complete(chat._stream_reply(prompt))
+    finally:
+        loop.run_until_complete(chat.engine.aclose())
+        loop.close()
+    return sink.chars
+
+
+def flatten_metrics(registry):
+    result = {}
+    for name, stats in registry.snapshot().items():
+        if name == "turns":
+            result["turn_statuses"] = stats
+            continue
+        if name == "retries":
+            result["retries"] = stats
+            continue
+        for key in ("avg", "p50", "p95"):
+            result[f"{name}_{key}"] = stats[key]
+    return result
+
+
+def turn_result(turns, wall, registry, client):
+    result = {"turns": turns, "wall_s": round(wall, 4), "turns_per_s": round(turns / wall, 3) if wall else 0.0}
+    result.update(flatten_metrics(registry))
+    result["fake_server"] = client.stats.as_dict()
+    return result
+
+
+# --- SCENARIOS ---
+
+def cli_long_history(args, workdir, image_server):
+    client = FakeGeminiClient(FakeProfile(ttft_s=0.05, chunks_per_s=200, response_chars=1500))
+    chat = make_cli(client, ["--max-context-tokens", str(CONTEXT_BUDGET_TOKENS)])
+    chat.history.extend(long_history(HISTORY_TURNS))
+    started = time.perf_counter()
+    run_cli_turns(chat, [f"follow-up question {i}" for i in range(args.turns)])
+    return turn_result(args.turns, time.perf_counter() - started, chat.metrics, client)
+
+
+def cli_large_response(args, workdir, image_server):
+    client = FakeGeminiClient(FakeProfile(ttft_s=0.05, chunk_chars=200, chunks_per_s=0, response_chars=200_000))
+    chat = make_cli(client)
+    turns = max(1, args.turns // 4)
+    started = time.perf_counter()
+    printed = run_cli_turns(chat, [f"write a long report {i}" for i in range(turns)])
+    result = turn_result(turns, time.perf_counter() - started, chat.metrics, client)
+    result["printed_chars"] = printed
+    return result
+
+
+def cli_flaky_stream(args, workdir, image_server):
+    profile = FakeProfile(ttft_s=0.05, chunks_per_s=200, response_chars=1500, error_rate=0.1, disconnect_rate=0.3)
+    client = FakeGeminiClient(profile)
+    chat = make_cli(client)
+    chat.engine.retry.base_delay = 0.02
+    started = time.perf_counter()
+    run_cli_turns(chat, [f"question {i}" for i in range(args.turns)])
+    result = turn_result(args.turns, time.perf_counter() - started, chat.metrics, client)
+    # A resumed answer must read exactly like an uninterrupted one
+    expected = full_response(profile)
+    answers = [message["parts"][0]["text"] for message in chat.history if message["role"] == "model"]
+    result.update(
+        answered=len(answers),
+        intact_answers=sum(answer == expected for answer in answers),
+        history_consistent=len(chat.history) == 2 * len(answers),
+    )
+    return result
+
+
+def gui_text_turns(args, workdir, image_server):
+    journal = ChatJournal(journal_path_for(os.path.join(workdir, gui_chat.LOG_FILE_NAME)))
+    history = long_history(HISTORY_TURNS)
+    for i in range(0, len(history), 2):
+        journal.append_turn(history[i:i + 2])
+
+    client = FakeGeminiClient(FakeProfile(ttft_s=0.05, chunk_chars=20, chunks_per_s=400, response_chars=4000))
+    with contextlib.redirect_stdout(NullWriter()):
+        app = HeadlessGui(client, workdir, max_context_tokens=CONTEXT_BUDGET_TOKENS)
+        try:
+            started = time.perf_counter()
+            for i in range(args.turns):
+                app.run_turn(f"follow-up question {i}")
+            wall = time.perf_counter() - started
+        finally:
+            app.close()
+    result = turn_result(args.turns, wall, app.metrics, client)
+    result.update(
+        history_load_s=round(app.load_seconds, 4),
+        ui_thread_s=round(app.master.ui_seconds, 4),
+        ui_callbacks=app.master.callbacks,
+        rendered_chars=app.transcript.rendered_chars,
+    )
+    return result
+
+
+def gui_image_turns(args, workdir, image_server):
+    client = FakeGeminiClient(FakeProfile(ttft_s=0.05, image_latency_s=0.2), image_server=image_server)
+    turns = max(1, args.turns // 4)
+    with contextlib.redirect_stdout(NullWriter()):
+        app = HeadlessGui(client, workdir, image_count=IMAGES_PER_TURN)
+        try:
+            started = time.perf_counter()
+            for i in range(turns):
+                app.run_turn(f"generate an image of skyline number {i}")
+            wall = time.perf_counter() - started
+        finally:
+            app.close()
+    result = turn_result(turns, wall, app.metrics, client)
+    result.update(
+        ui_thread_s=round(app.master.ui_seconds, 4),
+        images_displayed=app.images_shown,
+        image_downloads=image_server.requests,
+        http_connections=app.pool_metrics.connections,
+    )
+    return result
+
+
+def batch_concurrent(args, workdir, image_server):
+    in_path = os.path.join(workdir, "batch_prompts.jsonl")
+    out_path = os.path.join(workdir, "batch_results.jsonl")
+    with open(in_path, "w", encoding="utf-8") as f:
+        for i in range(args.batch_size):
+            f.write(json.dumps({"id": f"p{i}", "prompt": f"summarize document {i}"}) + "\n")
+
+    client = FakeGeminiClient(FakeProfile(ttft_s=0.1, chunks_per_s=100, response_chars=800, error_rate=0.05))
+    chat = make_cli(client, ["--batch", in_path, "--out", out_path, "--concurrency", str(args.concurrency)])
+    started = time.perf_counter()
+    with patched(batch_runner, "BACKOFF_BASE_SECONDS", 0.05), contextlib.redirect_stdout(NullWriter()):
+        chat.run_batch()
+    wall = time.perf_counter() - started
+
+    with open(out_path, "r", encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    latencies = sorted(r["latency_s"] for r in results if "error" not in r)
+    completed = len(latencies)
+    result = turn_result(len(results), wall, chat.metrics, client)
+    result.update(
+        completed=completed,
+        failed=len(results) - completed,
+        prompt_retries=sum(r["attempts"] - 1 for r in results),
+        # Every attempt is one upstream request charged to the rate buckets
+        attempts=sum(r["attempts"] for r in results),
+        concurrency=args.concurrency,
+        throughput_req_s=round(completed / wall, 3) if wall else 0.0,
+        latency_p50_s=batch_runner.percentile(latencies, 50),
+        latency_p95_s=batch_runner.percentile(latencies, 95),
+        latency_p99_s=batch_runner.percentile(latencies, 99),
+    )
+    return result
+
+
+SCENARIOS = {
+    "cli_long_history": cli_long_history,
+    "cli_large_response": cli_large_response,
+    "cli_flaky_stream": cli_flaky_stream,
+    "gui_text_turns": gui_text_turns,
+    "gui_image_turns": gui_image_turns,
+    "batch_concurrent": batch_concurrent,
+}
+
+
+# --- REPORTING ---
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """Prints every numeric metric present in both runs with its relative change."""
+    print(f"\n--- Compared with {baseline['meta'].get('commit')} ---")
+    print(f"{'scenario.metric':<48}{'baseline':>12}{'current':>12}{'change':>10}")
+    for scenario, values in current["scenarios"].items():
+        old_values = baseline["scenarios"].get(scenario, {})
+        for name, value in values.items():
+            old = old_values.get(name)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{scenario + '.' + name:<48}{old:>12.4g}{value:>12.4g}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), default=None,
+                        help="Scenario to run (repeatable). Default: all.")
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--out', type=str, default='bench_offline.json')
+    parser.add_argument('--compare', type=str, default=None, metavar='BASELINE.json')
+    args = parser.parse_args()
+
+    run = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "turns": args.turns,
+        },
+        "scenarios": {},
+    }
+    image_server = FakeImageServer()
+    try:
+        for name in args.scenario or SCENARIOS:
+            with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+                result = SCENARIOS[name](args, workdir, image_server)
+            run["scenarios"][name] = result
+            print(json.dumps({"scenario": name, **result}))
+    finally:
+        image_server.close()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Tracks start-up import cost of the entry points with `python -X importtime`.
+
+Each module is imported in a fresh interpreter --repeat times; the
+importtime report is parsed and the median is kept. The report lists the
+slowest imports and which heavy dependencies were pulled in at import time
+(gui_chat should defer them to its warm-up thread).
+
+Usage:
+    python benchmarks/bench_startup.py [--module gui_chat ...] [--repeat 5] [--out startup.json]
+    python benchmarks/bench_startup.py --out new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ("gui_chat", "gemini_chat_cli_legacy")
+# Dependencies that should not be imported before the window is shown
+HEAVY_MODULES = ("google.genai", "PIL.Image", "requests")
+
+
+def parse_importtime(stderr):
+    """Returns {module: cumulative_us} from an -X importtime report."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # header line
+        modules[fields[2].strip()] = int(fields[1])
+    return modules
+
+
+def measure(module, repeat):
+    walls, totals, runs = [], [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT, capture_output=True, text=True
+        )
+        walls.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+            return {"error": error}
+        modules = parse_importtime(result.stderr)
+        totals.append(modules.get(module, 0) / 1000)
+        runs.append(modules)
+
+    slowest = {}
+    for name in runs[0]:
+        slowest[name] = statistics.median(run.get(name, 0) for run in runs) / 1000
+    top = sorted(slowest.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "wall_ms": round(statistics.median(walls), 2),
+        "import_ms": round(statistics.median(totals), 2),
+        "heavy_imports": [name for name in HEAVY_MODULES if name in runs[0]],
+        "slowest": [{"module": name, "cumulative_ms": round(ms, 2)} for name, ms in top[:15]],
+    }
+
+
+def compare(baseline, current):
+    print(f"\n--- Compared with {baseline['meta'].get('commit')} ---")
+    print(f"{'module.metric':<40}{'baseline':>12}{'current':>12}{'change':>10}")
+    for module, values in current["modules"].items():
+        old_values = baseline["modules"].get(module, {})
+        for name in ("wall_ms", "import_ms"):
+            old, value = old_values.get(name), values.get(name)
+            if not isinstance(old, (int, float)) or not isinstance(value, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{module + '.' + name:<40}{old:>12.1f}{value:>12.1f}{change:>10}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=ROOT, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', action='append', default=None,
+                        help="Module to import (repeatable). Default: gui_chat and gemini_chat_cli_legacy.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', type=str, default='bench_startup.json')
+    parser.add_argument('--compare', type=str, default=None, metavar='BASELINE.json')
+    args = parser.parse_args()
+
+    run = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+        },
+        "modules": {},
+    }
+    for module in args.module or DEFAULT_MODULES:
+        result = measure(module, max(1, args.repeat))
+        run["modules"][module] = result
+        if "error" in result:
+            print(f"{module}: import failed ({result['error']})")
+            continue
+        print(f"\n{module}: import {result['import_ms']:.1f} ms, interpreter wall {result['wall_ms']:.1f} ms")
+        print(f"  heavy modules at import: {', '.join(result['heavy_imports']) or 'none'}")
+        for entry in result["slowest"][:10]:
+            print(f"  {entry['cumulative_ms']:>9.1f} ms  {entry['module']}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), run)
+
+
+if __name__ == "__main__":
+    main()
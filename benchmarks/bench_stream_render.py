@@ -0,0 +1,147 @@
+"""
+Replays a fast model stream into the chat TranscriptWindow and reports the UI-thread cost.
+
+  per-chunk  one master.after(0, ...) per chunk (the previous behaviour)
+  coalesced  StreamBuffer drained by a single STREAM_TICK_MS tick (current behaviour)
+
+Both modes render like the GUI: start_block, stream() per update, then
+finish_block() with the full response.
+
+Usage:
+    python benchmarks/bench_stream_render.py [--chunks 10000] [--chunk-size 12]
+
+Needs a display; on a headless machine run it under xvfb-run.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import scrolledtext
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream_buffer import StreamBuffer, STREAM_TICK_MS
+from transcript_window import TranscriptWindow
+
+MODEL_ROLE_NAME = "Gemini"
+
+
+class Probe:
+    """Counts time spent in UI callbacks and the number of callbacks waiting to run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ui_seconds = 0.0
+        self.callbacks = 0
+        self.depth = 0
+        self.max_depth = 0
+
+    def scheduled(self):
+        with self.lock:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def ran(self, started):
+        with self.lock:
+            self.depth -= 1
+            self.callbacks += 1
+            self.ui_seconds += time.perf_counter() - started
+
+
+def run_per_chunk(root, transcript, chunks, probe):
+    def update(text):
+        started = time.perf_counter()
+        transcript.stream(text)
+        probe.ran(started)
+
+    def worker():
+        parts = []
+        for chunk in chunks:
+            probe.scheduled()
+            root.after(0, update, chunk)
+            parts.append(chunk)
+        probe.scheduled()
+        root.after(0, finish, "".join(parts))
+
+    def finish(full_response):
+        started = time.perf_counter()
+        transcript.finish_block(full_response)
+        probe.ran(started)
+        root.quit()
+
+    transcript.start_block('model', MODEL_ROLE_NAME)
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def run_coalesced(root, transcript, chunks, probe):
+    buffer = StreamBuffer()
+    result = []
+
+    def tick():
+        started = time.perf_counter()
+        text = buffer.drain()
+        if text:
+            transcript.stream(text)
+        if result and not len(buffer):
+            transcript.finish_block(result[0])
+            probe.ran(started)
+            root.quit()
+            return
+        probe.ran(started)
+        probe.scheduled()
+        root.after(STREAM_TICK_MS, tick)
+
+    def worker():
+        parts = []
+        for chunk in chunks:
+            buffer.append(chunk)
+            parts.append(chunk)
+        result.append("".join(parts))
+
+    transcript.start_block('model', MODEL_ROLE_NAME)
+    probe.scheduled()
+    root.after(0, tick)
+    threading.Thread(target=worker, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=12)
+    args = parser.parse_args()
+
+    chunks = [("word " * args.chunk_size)[:args.chunk_size] for _ in range(args.chunks)]
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Tk is not available ({e}); run under a display or xvfb-run.")
+        sys.exit(1)
+    root.withdraw()
+
+    for mode, runner in (("per-chunk", run_per_chunk), ("coalesced", run_coalesced)):
+        display = scrolledtext.ScrolledText(root, wrap=tk.WORD, state='disabled')
+        transcript = TranscriptWindow(display)
+        probe = Probe()
+        started = time.perf_counter()
+        runner(root, transcript, chunks, probe)
+        root.mainloop()
+        wall = time.perf_counter() - started
+        print(json.dumps({
+            "mode": mode,
+            "chunks": args.chunks,
+            "wall_s": round(wall, 4),
+            "ui_thread_s": round(probe.ui_seconds, 4),
+            "ui_callbacks": probe.callbacks,
+            "max_queue_depth": probe.max_depth,
+        }))
+        display.destroy()
+
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Local stand-in for the genai endpoints the chat clients use, for offline benchmarks.
+
+FakeGeminiClient replaces genai.Client(): it implements client.aio.models
+(generate_content_stream, generate_images) and client.aio.caches with
+configurable latency, chunking, error injection and image-tool function
+calls. Every request's contents and config are kept in `client.sent`, and
+each cache's contents in `client.cached`. Generated image URLs point at FakeImageServer, a real HTTP server on
+127.0.0.1, so the GUI's download/decode path runs unchanged.
+"""
+import asyncio
+import os
+import random
+import struct
+import sys
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_engine import IMAGE_TOOL_NAME, RESUME_INSTRUCTION
+from context_window import estimate_tokens, message_text
+
+LOREM = (
+    "The quick brown fox jumps over the lazy dog while the model streams a long "
+    "answer about latency, throughput and the cost of rendering every chunk. "
+)
+
+
+class FakeProfile:
+    """
+    Behaviour of the fake model.
+
+    ttft_s             delay before the first chunk
+    chunk_chars        characters per streamed chunk
+    chunks_per_s       chunk rate after the first chunk (0 = as fast as possible)
+    response_chars     length of every text answer
+    error_rate         probability that a request fails with `error_code` before streaming
+    error_code         status code of injected errors (429/5xx are retried)
+    retry_after_s      RetryInfo delay attached to injected errors (None = no hint)
+    disconnect_rate    probability that a stream drops with a connection reset halfway through
+    image_keyword      prompts containing this word get an image-tool function call
+    image_latency_s    delay of generate_images
+    image_size         width/height in pixels of the served PNGs
+    cache_min_tokens   caches.create rejects smaller contents with a 400, like the real API
+    """
+
+    def __init__(self, ttft_s=0.2, chunk_chars=40, chunks_per_s=50, response_chars=2000,
+                 error_rate=0.0, error_code=503, retry_after_s=None, disconnect_rate=0.0,
+                 image_keyword="image", image_latency_s=0.5, image_size=1024, cache_min_tokens=0, seed=0):
+        self.ttft_s = ttft_s
+        self.chunk_chars = chunk_chars
+        self.chunks_per_s = chunks_per_s
+        self.response_chars = response_chars
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.retry_after_s = retry_after_s
+        self.disconnect_rate = disconnect_rate
+        self.image_keyword = image_keyword
+        self.image_latency_s = image_latency_s
+        self.image_size = image_size
+        self.cache_min_tokens = cache_min_tokens
+        self.seed = seed
+
+
+def full_response(profile):
+    """The text of every (uninterrupted) answer of the fake model."""
+    return (LOREM * (profile.response_chars // len(LOREM) + 1))[:profile.response_chars]
+
+
+class FakeAPIError(Exception):
+    """Raised for injected failures; `code` and `details` mirror genai's APIError."""
+
+    def __init__(self, code, message="injected error", retry_after_s=None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.details = None
+        if retry_after_s is not None:
+            retry_info = {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_after_s}s"}
+            self.details = {"error": {"code": code, "details": [retry_info]}}
+
+
+class FakeFunctionCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeChunk:
+    def __init__(self, text=None, function_calls=None, usage_metadata=None):
+        self.text = text
+        self.function_calls = function_calls
+        self.usage_metadata = usage_metadata
+
+
+class FakeStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.disconnects = 0
+        self.resumes = 0
+        self.chunks = 0
+        self.image_requests = 0
+        self.caches_created = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class _Models:
+    def __init__(self, profile, stats, image_server, sent):
+        self.profile = profile
+        self.stats = stats
+        self.image_server = image_server
+        self.sent = sent
+        self._random = random.Random(profile.seed)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.stats.requests += 1
+        self.sent.append({"model": model, "contents": list(contents), "config": dict(config or {})})
+        if self.profile.error_rate and self._random.random() < self.profile.error_rate:
+            self.stats.errors += 1
+            await asyncio.sleep(self.profile.ttft_s / 4)
+            raise FakeAPIError(self.profile.error_code, retry_after_s=self.profile.retry_after_s)
+        disconnect = bool(self.profile.disconnect_rate) and self._random.random() < self.profile.disconnect_rate
+        return self._stream(contents, disconnect)
+
+    async def _stream(self, contents, disconnect=False):
+        profile = self.profile
+        prompt = message_text(contents[-1]) if contents else ""
+        prompt_tokens = sum(estimate_tokens(message_text(message)) for message in contents)
+        await asyncio.sleep(profile.ttft_s)
+
+        if profile.image_keyword and profile.image_keyword in prompt.lower():
+            self.stats.chunks += 1
+            yield FakeChunk(function_calls=[FakeFunctionCall(IMAGE_TOOL_NAME, {"prompts": [prompt]})])
+            return
+
+        text = full_response(profile)
+        if prompt == RESUME_INSTRUCTION and len(contents) >= 2:
+            # Continue after the partial answer, restating its last few words like a real model might
+            self.stats.resumes += 1
+            written = len(message_text(contents[-2]))
+            text = text[max(0, written - 12):]
+        interval = 1.0 / profile.chunks_per_s if profile.chunks_per_s else 0
+        for start in range(0, len(text), profile.chunk_chars):
+            if start and interval:
+                await asyncio.sleep(interval)
+            if disconnect and start >= len(text) // 2:
+                self.stats.disconnects += 1
+                raise ConnectionResetError("injected disconnect")
+            self.stats.chunks += 1
+            yield FakeChunk(text=text[start:start + profile.chunk_chars])
+        yield FakeChunk(text="", usage_metadata=FakeUsage(prompt_tokens, estimate_tokens(text)))
+
+    async def generate_images(self, model, prompt, config=None):
+        self.stats.image_requests += 1
+        request_number = self.stats.image_requests
+        await asyncio.sleep(self.profile.image_latency_s)
+        count = (config or {}).get("number_of_images", 1)
+        images = [_GeneratedImage(self.image_server.url_for(request_number * 100 + i)) for i in range(count)]
+        return _ImagesResult(images)
+
+
+class _GeneratedImage:
+    def __init__(self, uri):
+        self.uri = uri
+
+
+class _ImagesResult:
+    def __init__(self, generated_images):
+        self.generated_images = generated_images
+
+
+class _CachedContent:
+    def __init__(self, name):
+        self.name = name
+
+
+class _Caches:
+    def __init__(self, profile, stats, cached):
+        self.profile = profile
+        self.stats = stats
+        self.cached = cached
+
+    async def create(self, model, config=None):
+        config = config or {}
+        contents = list(config.get("contents") or [])
+        tokens = estimate_tokens(config.get("system_instruction")) + sum(
+            estimate_tokens(message_text(message)) for message in contents)
+        if tokens < self.profile.cache_min_tokens:
+            raise FakeAPIError(400, f"Cached content is too small. min_total_token_count={self.profile.cache_min_tokens}")
+        self.stats.caches_created += 1
+        name = f"cachedContents/fake-{self.stats.caches_created}"
+        self.cached[name] = contents
+        return _CachedContent(name)
+
+    async def update(self, name, config=None):
+        return _CachedContent(name)
+
+    async def delete(self, name):
+        return None
+
+
+class _Aio:
+    def __init__(self, models, caches):
+        self.models = models
+        self.caches = caches
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client() covering the async surface used by ChatEngine."""
+
+    def __init__(self, profile=None, image_server=None):
+        self.profile = profile or FakeProfile()
+        self.stats = FakeStats()
+        self.sent = []      # {"model", "contents", "config"} of every generate_content_stream call
+        self.cached = {}    # cache name -> contents it was created with
+        self.aio = _Aio(
+            _Models(self.profile, self.stats, image_server, self.sent),
+            _Caches(self.profile, self.stats, self.cached)
+        )
+
+
+def png_bytes(width, height, seed=0):
+    """Deterministic RGB gradient PNG, built without PIL."""
+    base = bytes(((x + seed) & 0xFF, (x * 3 + seed * 7) & 0xFF, (x * 5) & 0xFF)[c] for x in range(width) for c in range(3))
+    rows = []
+    for y in range(height):
+        # Each row is the base row rotated by one pixel: cheap, yet not trivially compressible
+        shift = (y % width) * 3
+        rows.append(b"\x00" + base[shift:] + base[:shift])  # filter type: None
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(b"".join(rows), 6)) + chunk(b"IEND", b""))
+
+
+class FakeImageServer:
+    """Serves generated PNGs at http://127.0.0.1:<port>/image/<n>.png on a daemon thread."""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.requests = 0
+        self._images = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.rsplit("/", 1)[-1]
+                if not self.path.startswith("/image/") or not name.endswith(".png"):
+                    self.send_error(404)
+                    return
+                data = server.image(int(name[:-4]))
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-image-server", daemon=True)
+        self.thread.start()
+
+    def url_for(self, number):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/image/{number}.png"
+
+    def image(self, number):
+        with self._lock:
+            self.requests += 1
+            if number not in self._images:
+                self._images[number] = png_bytes(self.size, self.size, seed=number)
+            return self._images[number]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,520 @@
+import asyncio
+import threading
+from collections import namedtuple
+
+from context_cache import REBUILD_TAIL_TOKENS, ContextCache
+from context_window import ContextWindow, estimate_tokens, message_text
+from response_cache import cache_key
+from retry_policy import CircuitOpenError, RetryPolicy, is_retryable
+from turn_metrics import MetricsRegistry
+
+# --- MODEL CONSTANTS ---
+MODEL_FLASH = 'gemini-2.5-flash'
+MODEL_PRO = 'gemini-2.5-pro'
+MODEL_AUTO = 'auto'
+MODEL_ALIASES = {'flash': MODEL_FLASH, 'pro': MODEL_PRO}
+IMAGE_MODEL = 'imagen-3.0-generate-002'
+IMAGE_TOOL_NAME = 'image_generation:generate_images'
+# Most images a single generate_images request returns; larger counts are split into parallel requests
+IMAGES_PER_REQUEST = 4
+DEFAULT_SESSION = "default"
+TRUNCATED_MARKER = " [truncated]"
+# A stream that drops mid-answer is re-requested with the partial answer this many times
+MAX_RESUMES = 3
+RESUME_INSTRUCTION = (
+    "Your previous answer was cut off by a connection error right after the text above. "
+    "Continue exactly where it stopped, without repeating or summarizing what was already written."
+)
+# Repeated text shorter than this at the start of a continuation is kept (it may be legitimate)
+MIN_RESUME_OVERLAP = 8
+RESUME_OVERLAP_CHARS = 200
+
+# Events yielded by ChatEngine.stream_turn():
+#   ("text", chunk_text)           streamed answer text
+#   ("image_request", prompt)      the model asked for an image; generation is starting
+#   ("images", [uri, ...])         generated image URIs, yielded per request as each one finishes
+#                                  (once, empty, if generation failed)
+#   ("done", final_text)           the turn completed and was added to the history
+#   ("cancelled", partial_text)    the turn was stopped; the partial answer (with
+#                                  TRUNCATED_MARKER) was added to the history
+TurnEvent = namedtuple("TurnEvent", ["kind", "data"])
+# Stand-in for a response chunk whose text had to be changed (see strip_overlap)
+StreamChunk = namedtuple("StreamChunk", ["text", "function_calls", "usage_metadata"])
+
+
+def resolve_model_name(name):
+    """Maps the 'flash'/'pro' shorthands to full model names."""
+    return MODEL_ALIASES.get(name.lower(), name)
+
+
+def build_config(temperature, system_instruction=None):
+    config = {"temperature": temperature}
+    if system_instruction:
+        config["system_instruction"] = system_instruction
+    return config
+
+
+def text_message(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def continuation_contents(contents, partial_text):
+    """The request that resumes an answer cut off after `partial_text`."""
+    return contents + [text_message("model", partial_text), text_message("user", RESUME_INSTRUCTION)]
+
+
+def strip_overlap(previous, text):
+    """Drops the start of `text` that repeats the end of `previous` (a continuation restating its last words)."""
+    for size in range(min(len(previous), len(text)), MIN_RESUME_OVERLAP - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:]
+    return text
+
+
+def find_image_call(chunk):
+    for call in chunk.function_calls or []:
+        if call.name == IMAGE_TOOL_NAME:
+            return call
+    return None
+
+
+class ChatSession:
+    """History and per-turn state of one conversation served by a ChatEngine."""
+
+    def __init__(self, session_id, history, context):
+        self.session_id = session_id
+        self.history = history
+        self.context = context
+        self.task = None        # asyncio task currently streaming a turn
+        self.cancel_requested = False
+        self.waiting = 0        # turns waiting for the lock
+        self.cancel_pending = False  # cancel() arrived while a turn waited for the lock
+        self.lock = None        # created on the engine's loop; serializes turns
+        self.context_caches = {}  # model name -> ContextCache
+        self.last_usage = None  # usage_metadata of the last completed turn
+        self.last_model = None  # model that answered the last turn
+
+
+class ChatEngine:
+    """
+    Front-end independent chat core built on the genai async client (client.aio).
+
+    Each session keeps its own history and context window, so one engine (and
+    one event loop) can serve many concurrent conversations. Turns of the same
+    session run one after another. A failed turn is rolled back so the history
+    never ends with an unanswered user message.
+
+    With a `response_cache`, a turn whose model, config and selected contents
+    were seen before is replayed from the cache through the same events.
+    With `context_caching`, each session keeps its system instruction and
+    stable history prefix in a server-side cached-content handle.
+    Every turn is timed into `metrics` (a MetricsRegistry). With a `router`
+    (a ModelRouter, used when model_name is MODEL_AUTO) each turn's model is
+    chosen per prompt, and a slow turn may be hedged with a second model.
+
+    Requests are retried under `retry` (a RetryPolicy with a circuit breaker
+    per model), and a stream that drops mid-answer is resumed, so front ends
+    see one continuous answer. Image requests generate `image_count` images.
+    """
+
+    def __init__(self, client, model_name, config, max_context_tokens=None, response_cache=None,
+                 context_caching=False, metrics=None, router=None, retry=None, image_count=1):
+        self.client = client
+        self.model_name = model_name
+        self.config = config
+        self.max_context_tokens = max_context_tokens
+        self.response_cache = response_cache
+        self.context_caching = context_caching
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.router = router
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.image_count = max(1, image_count)
+        self.sessions = {}
+
+    def session(self, session_id=DEFAULT_SESSION, history=None):
+        """Returns the session, creating it (optionally seeded with `history`) on first use."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            # A cached prefix only stays usable if the summary at its start does not change every turn
+            context = ContextWindow(
+                self.max_context_tokens, system_instruction=self.config.get("system_instruction"),
+                cut_slack_tokens=REBUILD_TAIL_TOKENS if self.context_caching else 0
+            )
+            session = ChatSession(session_id, history if history is not None else [], context)
+            self.sessions[session_id] = session
+        return session
+
+    async def close_session(self, session_id):
+        """Forgets a session and deletes its server-side context cache, if any."""
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            for context_cache in session.context_caches.values():
+                await context_cache.close()
+
+    async def aclose(self):
+        """Releases server-side resources (cached-content handles) of every session."""
+        for session in self.sessions.values():
+            for context_cache in session.context_caches.values():
+                await context_cache.close()
+
+    def cancel(self, session_id=DEFAULT_SESSION):
+        """
+        Stops the turn in flight for `session_id`: the upstream stream is closed and
+        stream_turn() yields a "cancelled" event instead of raising. A turn that is
+        still waiting for the session is cancelled before it sends anything. Must be
+        called on the engine's loop (or while it is not running).
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        if session.task is not None:
+            session.cancel_requested = True
+            session.task.cancel()
+        elif session.waiting:
+            session.cancel_pending = True
+
+    def is_busy(self, session_id=DEFAULT_SESSION):
+        """True while a turn of the session is streaming or waiting to start."""
+        session = self.sessions.get(session_id)
+        return session is not None and (session.task is not None or session.waiting > 0)
+
+    async def stream_turn(self, prompt, session_id=DEFAULT_SESSION):
+        """Sends `prompt` in the given session and yields TurnEvents as the answer streams in."""
+        session = self.session(session_id)
+        if session.lock is None:
+            session.lock = asyncio.Lock()
+
+        session.waiting += 1
+        acquired = False
+        try:
+            await session.lock.acquire()
+            acquired = True
+        finally:
+            session.waiting -= 1
+            if not acquired and not session.waiting:
+                session.cancel_pending = False  # the turns it was meant for are gone
+        try:
+            session.task = asyncio.current_task()
+            session.history.append(text_message("user", prompt))
+            completed = False
+            stream = None
+            parts = []
+            timer = self.metrics.start_turn(session_id, self.model_name)
+            status = "error"
+            usage = None
+            decision = None
+            served = {"model": self.model_name, "hedged": False}
+            try:
+                if session.cancel_pending:
+                    # Stopped while waiting for the session: nothing has been sent
+                    session.cancel_pending = False
+                    session.cancel_requested = True
+                    raise asyncio.CancelledError
+                contents = session.context.select(session.history)
+                if self.router is not None:
+                    decision = self.router.route(prompt, session.context.last_sent_tokens)
+                    served["model"] = decision.model
+                    # Skip a model whose circuit breaker is open while the other one is usable
+                    alternative = self.router.alternative(decision.model)
+                    if not self.retry.available(decision.model) and self.retry.available(alternative):
+                        decision = decision._replace(model=alternative, reason="circuit", hedge_model=None, hedge_after=None)
+                        served["model"] = decision.model
+                key = None
+                if self.response_cache is not None:
+                    key = cache_key(served["model"], self.config, contents)
+                    cached = self.response_cache.get(key)
+                    if cached is not None:
+                        for text in cached:
+                            timer.chunk()
+                            parts.append(text)
+                            yield TurnEvent("text", text)
+                        full_text = "".join(parts)
+                        session.history.append(text_message("model", full_text))
+                        completed = True
+                        status = "cache_hit"
+                        yield TurnEvent("done", full_text)
+                        return
+
+                if decision is not None and decision.hedge_model is not None:
+                    stream = self._hedged_stream(session, contents, decision, timer, served)
+                else:
+                    stream = self._model_stream(session, contents, served["model"], timer)
+
+                image_call = None
+                async for chunk in stream:
+                    if chunk.usage_metadata:
+                        usage = session.last_usage = chunk.usage_metadata
+
+                    # A function-call part switches the turn over to the image path
+                    image_call = find_image_call(chunk)
+                    if image_call:
+                        break
+
+                    if chunk.text:
+                        timer.chunk()
+                        parts.append(chunk.text)
+                        yield TurnEvent("text", chunk.text)
+
+                if image_call:
+                    await self._close_stream(stream)
+                    stream = None
+                    prompt_text = image_call.args['prompts'][0]
+                    yield TurnEvent("image_request", prompt_text)
+                    generated = 0
+                    async for uris in self._image_batches(prompt_text):
+                        generated += len(uris)
+                        yield TurnEvent("images", uris)
+                    if not generated:
+                        yield TurnEvent("images", [])
+                        return
+                    if generated == 1:
+                        full_text = f"Generated image for: {prompt_text}"
+                    else:
+                        full_text = f"Generated {generated} images for: {prompt_text}"
+                    status = "image"
+                else:
+                    status = "ok"
+                    full_text = "".join(parts)
+                    if key is not None:
+                        self.response_cache.put(key, parts)
+
+                session.history.append(text_message("model", full_text))
+                completed = True
+                yield TurnEvent("done", full_text)
+            except asyncio.CancelledError:
+                if not session.cancel_requested:
+                    raise
+                # Cancelled through cancel(): stop billing tokens first, then keep the partial answer
+                task = asyncio.current_task()
+                if hasattr(task, "uncancel"):
+                    task.uncancel()
+                if stream is not None:
+                    await self._close_stream(stream)
+                    stream = None
+                partial_text = "".join(parts) + TRUNCATED_MARKER
+                session.history.append(text_message("model", partial_text))
+                completed = True
+                status = "cancelled"
+                yield TurnEvent("cancelled", partial_text)
+            finally:
+                session.task = None
+                session.cancel_requested = False
+                if stream is not None:
+                    await self._close_stream(stream)
+                if not completed:
+                    self._rollback(session)
+                session.last_model = served["model"]
+                timer.record["model"] = served["model"]
+                timer.finish(status, self._output_tokens(usage, parts))
+                if decision is not None:
+                    self.router.record(decision, served["model"], status, timer.record, session_id, served["hedged"])
+        finally:
+            session.lock.release()
+
+    async def _model_stream(self, session, contents, model, timer):
+        """
+        Yields the chunks of one answer; closing this generator closes the upstream response.
+
+        Failed requests are retried under self.retry. If the stream drops after
+        some text arrived, the request is sent again with the partial answer as
+        context and only the continuation is yielded.
+        """
+        breaker = self.retry.breaker(model)
+        received = []
+        attempt = 0
+        resumes = 0
+        while True:
+            upstream = None
+            progressed = False
+            try:
+                if not breaker.allow():
+                    raise CircuitOpenError(model, breaker.retry_in())
+                partial_text = "".join(received)
+                request = continuation_contents(contents, partial_text) if received else contents
+                overlap = partial_text[-RESUME_OVERLAP_CHARS:]
+                upstream = await self._open_stream(session, request, model, timer)
+                async for chunk in upstream:
+                    if not progressed:
+                        progressed = True
+                        breaker.record_success()
+                    if overlap and chunk.text:
+                        chunk = StreamChunk(strip_overlap(overlap, chunk.text), chunk.function_calls, chunk.usage_metadata)
+                        overlap = ""
+                    if chunk.text:
+                        received.append(chunk.text)
+                    yield chunk
+                breaker.record_success()
+                return
+            except Exception as e:
+                if is_retryable(e) and not isinstance(e, CircuitOpenError):
+                    breaker.record_failure()
+                # Backoff restarts once a connection delivered something
+                attempt = 1 if progressed else attempt + 1
+                delay = self.retry.delay(attempt, e)
+                if received:
+                    resumes += 1
+                if delay is None or resumes > MAX_RESUMES:
+                    raise
+                timer.record["retries"] = timer.record.get("retries", 0) + 1
+            finally:
+                if upstream is not None:
+                    await self._close_stream(upstream)
+            await asyncio.sleep(delay)
+
+    async def _hedged_stream(self, session, contents, decision, timer, served):
+        """
+        Streams from decision.model; if it has not produced a chunk after
+        decision.hedge_after seconds, decision.hedge_model is requested as well.
+        The first request to produce a chunk wins and the other one is closed.
+        """
+        streams = {}
+        try:
+            primary = self._model_stream(session, contents, decision.model, timer)
+            streams[asyncio.ensure_future(primary.__anext__())] = (decision.model, primary)
+            done, _ = await asyncio.wait(streams, timeout=decision.hedge_after)
+            if not done:
+                served["hedged"] = True
+                hedge = self._model_stream(session, contents, decision.hedge_model, timer)
+                streams[asyncio.ensure_future(hedge.__anext__())] = (decision.hedge_model, hedge)
+
+            winner = None
+            error = None
+            pending = set(streams)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None or isinstance(future.exception(), StopAsyncIteration):
+                        winner = future
+                        break
+                    error = future.exception()
+            if winner is None:
+                raise error
+
+            model, stream = streams.pop(winner)
+            served["model"] = model
+            await self._abandon_streams(streams)
+            streams = {winner: (model, stream)}
+            if winner.exception() is not None:
+                return  # the winning answer was empty
+            yield winner.result()
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await self._abandon_streams(streams)
+
+    async def _abandon_streams(self, streams):
+        for future in streams:
+            future.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        for _, stream in streams.values():
+            await self._close_stream(stream)
+
+    def _context_cache(self, session, model):
+        context_cache = session.context_caches.get(model)
+        if context_cache is None:
+            context_cache = session.context_caches[model] = ContextCache(self.client, model)
+        return context_cache
+
+    async def _open_stream(self, session, contents, model, timer):
+        """Starts the request, sending the cached prefix by reference when context caching is on."""
+        send_contents, send_config = contents, self.config
+        context_cache = self._context_cache(session, model) if self.context_caching else None
+        if context_cache is not None:
+            send_contents, send_config = await context_cache.prepare(contents, self.config)
+        timer.request_sent(sum(len(message_text(message).encode("utf-8")) for message in send_contents))
+        try:
+            return await self.client.aio.models.generate_content_stream(
+                model=model,
+                contents=send_contents,
+                config=send_config
+            )
+        except Exception as e:
+            if send_config is self.config or is_retryable(e):
+                raise
+            # The cached handle was rejected (expired or deleted): retry once with the full request
+            context_cache.invalidate()
+            return await self.client.aio.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=self.config
+            )
+
+    async def _image_batches(self, prompt_text):
+        """
+        Requests self.image_count images as parallel generate_images calls and
+        yields each call's URIs as soon as it finishes. Failed calls are
+        skipped unless none succeeded.
+        """
+        sizes = [min(IMAGES_PER_REQUEST, self.image_count - start)
+                 for start in range(0, self.image_count, IMAGES_PER_REQUEST)]
+        tasks = [asyncio.ensure_future(self.generate_images(prompt_text, size)) for size in sizes]
+        error = None
+        generated = False
+        try:
+            for finished in asyncio.as_completed(tasks):
+                try:
+                    uris = await finished
+                except Exception as e:
+                    error = e
+                    continue
+                if uris:
+                    generated = True
+                    yield uris
+            if error is not None and not generated:
+                raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def generate_images(self, prompt_text, number_of_images=1):
+        """Returns the URIs of the generated images (possibly empty)."""
+        result = await self.client.aio.models.generate_images(
+            model=IMAGE_MODEL,
+            prompt=prompt_text,
+            config={'number_of_images': number_of_images}
+        )
+        return [image.uri for image in result.generated_images or []]
+
+    async def _close_stream(self, stream):
+        """Closes the upstream response so no more tokens are generated for this turn."""
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+
+    def _output_tokens(self, usage, parts):
+        # Prefer the server's count for this turn; fall back to the local estimate
+        count = getattr(usage, "candidates_token_count", None)
+        return count if count else estimate_tokens("".join(parts))
+
+    def _rollback(self, session):
+        # Drop the user message of a turn that did not complete
+        if session.history and session.history[-1].get("role") == "user":
+            session.history.pop()
+
+
+class EngineLoop:
+    """
+    Runs an asyncio event loop on a daemon thread, for front ends (like Tk)
+    whose own main loop is not asyncio.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="chat-engine-loop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        """Schedules a coroutine on the loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, fn, *args):
+        """Runs a plain callable on the loop thread (e.g. ChatEngine.cancel)."""
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def stop(self, timeout=2.0):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
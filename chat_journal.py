@@ -0,0 +1,250 @@
+import json
+import os
+import time
+
+JOURNAL_SUFFIX = ".jsonl"
+READ_BLOCK_SIZE = 64 * 1024
+COMPACT_EVERY = 200
+# Turns kept by periodic compaction unless a front end is told otherwise (0 keeps everything)
+MAX_TURNS = 5000
+
+
+def journal_path_for(history_file):
+    """Maps a history file name (e.g. chat_history.json) to its journal file name."""
+    if history_file.endswith(JOURNAL_SUFFIX):
+        return history_file
+    root, _ = os.path.splitext(history_file)
+    return root + JOURNAL_SUFFIX
+
+
+def group_turns(messages):
+    """Groups a flat message list into turns, each starting at a user message."""
+    turns = []
+    for message in messages:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class ChatJournal:
+    """
+    Append-only conversation store with one JSON line per completed turn.
+
+    Every turn is appended and fsynced as soon as it finishes, so a crash loses
+    at most the turn in flight. Loading reads the file backwards in blocks and
+    only parses the records needed to rebuild the recent context.
+
+    `index` (set by HistorySearch) is told about every appended turn and
+    every compaction. With `read_only` the file is never modified, not even
+    to repair a torn last line (readers skip it), so another process may
+    keep writing to it.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY, max_turns=None, read_only=False):
+        self.path = path
+        self.compact_every = compact_every
+        self.max_turns = max_turns
+        self.read_only = read_only
+        self.index = None
+        # Bytes dropped by compactions since opening; offsets saved earlier move back by the growth
+        self.removed_bytes = 0
+        self._appends_since_compact = 0
+        if not read_only:
+            self._repair_tail()
+
+    # --- WRITING ---
+
+    def append_turn(self, messages):
+        """Appends one turn (a list of history messages) and fsyncs it to disk."""
+        self._check_writable()
+        record = {"ts": time.time(), "messages": messages}
+        data = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            start = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if self.index is not None:
+            self.index.add_turn(record, start, start + len(data))
+
+        # Appends never leave corrupt lines behind, so only a turn limit can give compaction work
+        self._appends_since_compact += 1
+        if self.max_turns and self.compact_every and self._appends_since_compact >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the journal without corrupt lines (and beyond max_turns, if set).
+        Leaves the file alone if there is nothing to drop. Returns True if it was rewritten.
+        """
+        self._appends_since_compact = 0
+        if not os.path.exists(self.path):
+            return False
+        old_size = self.end_offset()
+        records = []
+        dropped = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = self._parse(line)
+                if record is not None:
+                    records.append(record)
+                elif line.strip():
+                    dropped += 1
+        trimmed = bool(self.max_turns) and len(records) > self.max_turns
+        if not (trimmed or dropped):
+            return False
+        if trimmed:
+            records = records[-self.max_turns:]
+        self._write_records(records)
+        self.removed_bytes += old_size - self.end_offset()
+        if self.index is not None:
+            self.index.on_compact(old_size, self.end_offset(), records[0]["ts"] if trimmed else None)
+        return True
+
+    def import_json(self, json_path):
+        """
+        One-time migration of a legacy chat_history.json list into the journal.
+        Does nothing if the journal already exists. Returns the number of messages imported.
+        """
+        if os.path.exists(self.path) or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                messages = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Could not migrate {json_path}: {e}")
+            return 0
+
+        now = time.time()
+        self._write_records([{"ts": now, "messages": turn} for turn in group_turns(messages)])
+        return len(messages)
+
+    # --- READING ---
+
+    def end_offset(self):
+        """Current size of the journal; a read_tail(end=...) cursor for everything written so far."""
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def iter_records(self, start=0):
+        """Yields (end_offset, record) for every complete turn after byte offset `start`, oldest first."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return  # a turn still being written
+                offset += len(line)
+                record = self._parse(line)
+                if record is not None:
+                    yield offset, record
+
+    def read_tail(self, max_messages, end=None):
+        """
+        Reads whole turns backwards from byte offset `end` (default: end of file)
+        until at least `max_messages` messages are collected.
+
+        Returns (offset, messages) where `offset` is the byte position of the
+        oldest turn returned; pass it back as `end` to page further into the past.
+        """
+        if not os.path.exists(self.path):
+            return 0, []
+
+        turns = []
+        count = 0
+        with open(self.path, "rb") as f:
+            if end is None:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+            first_offset = end
+            pos = end
+            carry = b""
+            while pos > 0 and count < max_messages:
+                size = min(READ_BLOCK_SIZE, pos)
+                pos -= size
+                f.seek(pos)
+                lines = (f.read(size) + carry).split(b"\n")
+
+                # The first piece may be the tail of a line that starts in an earlier block
+                if pos > 0:
+                    carry = lines.pop(0)
+                    offset = pos + len(carry) + 1
+                else:
+                    carry = b""
+                    offset = 0
+
+                starts = []
+                for line in lines:
+                    starts.append(offset)
+                    offset += len(line) + 1
+
+                for start, line in zip(reversed(starts), reversed(lines)):
+                    if count >= max_messages:
+                        break
+                    record = self._parse(line)
+                    if record is None:
+                        continue
+                    turns.append(record["messages"])
+                    count += len(record["messages"])
+                    first_offset = start
+
+        messages = []
+        for turn in reversed(turns):
+            messages.extend(turn)
+        return first_offset, messages
+
+    # --- INTERNALS ---
+
+    def _parse(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        if not isinstance(record, dict) or not isinstance(record.get("messages"), list):
+            return None
+        return record
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"{self.path} was opened read-only")
+
+    def _repair_tail(self):
+        """Truncates a partially written last line left behind by a crash mid-append."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+
+            pos = size
+            while pos > 0:
+                step = min(READ_BLOCK_SIZE, pos)
+                pos -= step
+                f.seek(pos)
+                newline = f.read(step).rfind(b"\n")
+                if newline != -1:
+                    f.truncate(pos + newline + 1)
+                    return
+            f.truncate(0)
+
+    def _write_records(self, records):
+        """Atomically replaces the journal file with `records`."""
+        self._check_writable()
+        tmp_path = self.path + ".tmp"
+        # Binary like append_turn, so line endings (and byte offsets) match on every platform
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write((json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
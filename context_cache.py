@@ -0,0 +1,149 @@
+import re
+import time
+
+from context_window import estimate_tokens, message_tokens
+from retry_policy import is_retryable
+
+# Gemini rejects cached contents below a per-model minimum size; smaller prefixes are sent inline
+MIN_CACHE_TOKENS = {"gemini-2.5-pro": 4096, "gemini-2.5-flash": 1024}
+DEFAULT_MIN_CACHE_TOKENS = 4096
+# Client errors that mean the model cannot cache contents at all
+UNSUPPORTED_STATUS_CODES = (400, 403, 404)
+TOO_SMALL_PATTERN = re.compile(r"too small|min_total_token_count|minimum", re.IGNORECASE)
+CACHE_TTL_SECONDS = 3600
+# Extend the TTL when less than this much time is left
+REFRESH_MARGIN_SECONDS = 300
+# Re-freeze the prefix once this many tokens have accumulated after it
+REBUILD_TAIL_TOKENS = 4096
+
+
+class ContextCache:
+    """
+    Manages a Gemini cached-content handle for one chat session.
+
+    The handle holds the system instruction plus a frozen prefix of the
+    contents. prepare() returns the contents and config to send: when the
+    current contents still start with the frozen prefix only the tail is
+    sent, with `cached_content` pointing at the handle. The prefix is
+    re-frozen (and the old handle deleted) when it no longer matches or
+    the uncached tail has grown past REBUILD_TAIL_TOKENS. The TTL is
+    extended shortly before it expires.
+
+    A prefix below the model's minimum (or one the server says is too small)
+    is sent inline until it has grown, and a transient failure (rate limit,
+    server error, dropped connection) is retried on a later turn. Only a
+    client error saying the model cannot cache switches caching off for the
+    session; requests are then sent unchanged.
+    """
+
+    def __init__(self, client, model_name, ttl_seconds=CACHE_TTL_SECONDS,
+                 min_tokens=None, rebuild_tail_tokens=REBUILD_TAIL_TOKENS):
+        self.client = client
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        if min_tokens is None:
+            min_tokens = MIN_CACHE_TOKENS.get(model_name, DEFAULT_MIN_CACHE_TOKENS)
+        self.min_tokens = min_tokens
+        self.rebuild_tail_tokens = rebuild_tail_tokens
+        self.supported = True
+
+        self.name = None
+        self._prefix = []
+        self._system_instruction = None
+        self._expires_at = 0.0
+
+        self.last_cached_tokens = 0
+
+    async def prepare(self, contents, config):
+        """Returns (contents, config) to send for this turn."""
+        self.last_cached_tokens = 0
+        if not self.supported:
+            return contents, config
+
+        system_instruction = config.get("system_instruction")
+        # Everything but the newest turn (the prompt being sent) is a candidate prefix
+        candidate = contents[:-1]
+
+        if not self._matches(candidate, system_instruction) or self._tail_tokens(candidate) > self.rebuild_tail_tokens:
+            await self._rebuild(candidate, system_instruction)
+            if not self.supported or self.name is None:
+                return contents, config
+        elif time.time() > self._expires_at - REFRESH_MARGIN_SECONDS:
+            await self._refresh()
+
+        if self.name is None:
+            return contents, config
+
+        send_config = {k: v for k, v in config.items() if k != "system_instruction"}
+        send_config["cached_content"] = self.name
+        self.last_cached_tokens = self._prefix_tokens(self._prefix, system_instruction)
+        return contents[len(self._prefix):], send_config
+
+    def invalidate(self):
+        """Forgets the handle (e.g. the server no longer knows it); the next turn rebuilds it."""
+        self.name = None
+        self._prefix = []
+        self._expires_at = 0.0
+
+    async def close(self):
+        """Deletes the server-side cache, if any."""
+        if self.name is not None:
+            name = self.name
+            self.invalidate()
+            try:
+                await self.client.aio.caches.delete(name=name)
+            except Exception:
+                pass
+
+    # --- INTERNALS ---
+
+    def _matches(self, candidate, system_instruction):
+        if self.name is None or system_instruction != self._system_instruction:
+            return False
+        return candidate[:len(self._prefix)] == self._prefix
+
+    def _tail_tokens(self, candidate):
+        return sum(message_tokens(message) for message in candidate[len(self._prefix):])
+
+    def _prefix_tokens(self, prefix, system_instruction):
+        return estimate_tokens(system_instruction) + sum(message_tokens(message) for message in prefix)
+
+    async def _rebuild(self, candidate, system_instruction):
+        await self.close()
+        prefix_tokens = self._prefix_tokens(candidate, system_instruction)
+        if prefix_tokens < self.min_tokens:
+            return
+
+        cache_config = {"ttl": f"{self.ttl_seconds}s"}
+        if candidate:
+            cache_config["contents"] = candidate
+        if system_instruction:
+            cache_config["system_instruction"] = system_instruction
+        try:
+            cached = await self.client.aio.caches.create(model=self.model_name, config=cache_config)
+        except Exception as e:
+            if is_retryable(e):
+                # Temporary; the next turn tries again
+                print(f"Could not create a context cache for {self.model_name}; retrying next turn. ({e})")
+            elif getattr(e, "code", None) in UNSUPPORTED_STATUS_CODES and TOO_SMALL_PATTERN.search(str(e)):
+                # The estimate undercounted: wait until the prefix is bigger than this one
+                self.min_tokens = prefix_tokens + 1
+            elif getattr(e, "code", None) in UNSUPPORTED_STATUS_CODES:
+                print(f"Context caching unavailable for {self.model_name}; sending full requests. ({e})")
+                self.supported = False
+            else:
+                print(f"Could not create a context cache for {self.model_name}: {e}")
+            return
+
+        self.name = cached.name
+        self._prefix = list(candidate)
+        self._system_instruction = system_instruction
+        self._expires_at = time.time() + self.ttl_seconds
+
+    async def _refresh(self):
+        try:
+            await self.client.aio.caches.update(name=self.name, config={"ttl": f"{self.ttl_seconds}s"})
+            self._expires_at = time.time() + self.ttl_seconds
+        except Exception:
+            # Expired or deleted on the server: rebuild on the next turn
+            self.invalidate()
@@ -0,0 +1,165 @@
+import bisect
+import re
+
+# Rough local tokenizer: word pieces of ~4 characters, punctuation counts as one token
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_RECENT_TURNS = 4
+SUMMARY_LINE_CHARS = 160
+SUMMARY_HEADER = "[Summary of earlier conversation]"
+
+
+def estimate_tokens(text):
+    """Cheap, deterministic token estimate used instead of a network count_tokens call."""
+    if not text:
+        return 0
+    tokens = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        tokens += (len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return tokens
+
+
+def message_text(message):
+    return "".join(part.get("text") or "" for part in message.get("parts", []))
+
+
+def message_tokens(message):
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message_text(message))
+
+
+class ContextWindow:
+    """
+    Chooses which part of the chat history is sent on each request.
+
+    Token counts are kept per message and only new messages are counted, so
+    selecting a window is O(turns) rather than O(characters). The system
+    instruction (sent through config) is always counted, the newest
+    `recent_turns` turns are always sent, older turns are included while they
+    fit the budget and the rest are folded into a rolling summary that is
+    extended, not rebuilt, as the cut-off moves forward.
+
+    With `cut_slack_tokens` the cut-off (and so the summary) stays where it is
+    until the verbatim part exceeds the budget by that much, so the start of
+    the contents is identical from turn to turn, as a server-side context
+    cache of it requires.
+    """
+
+    def __init__(self, max_tokens=None, recent_turns=DEFAULT_RECENT_TURNS, system_instruction=None,
+                 cut_slack_tokens=0):
+        self.max_tokens = max_tokens
+        self.recent_turns = max(1, recent_turns)
+        self.system_tokens = estimate_tokens(system_instruction)
+        self.cut_slack_tokens = cut_slack_tokens
+        self._cut = 0
+
+        self._ids = []           # id() of each counted message, to detect a replaced history
+        self._prefix = [0]       # _prefix[i] = tokens of history[:i]
+        self._turn_starts = []   # indices of user messages
+
+        self._summary_upto = 0
+        self._summary_lines = []
+        self._summary_tokens = 0
+
+        self.last_sent_tokens = 0
+        self.last_saved_tokens = 0
+
+    def select(self, history):
+        """Returns the list of contents to send for `history` and updates last_*_tokens."""
+        self._sync(history)
+        full_tokens = self.system_tokens + self._prefix[-1]
+
+        cut = self._cut = self._choose_cut()
+        if cut == 0:
+            self.last_sent_tokens = full_tokens
+            self.last_saved_tokens = 0
+            return history
+
+        summary = self._summarize(history, cut)
+        contents = [summary] + history[cut:]
+        self.last_sent_tokens = (
+            self.system_tokens + message_tokens(summary) + self._prefix[-1] - self._prefix[cut]
+        )
+        self.last_saved_tokens = max(0, full_tokens - self.last_sent_tokens)
+        return contents
+
+    # --- INTERNALS ---
+
+    def _sync(self, history):
+        """Counts only messages that were appended since the last call."""
+        known = len(self._ids)
+        if known > len(history) or (known and self._ids[-1] != id(history[known - 1])):
+            # History was truncated or replaced: fall back to the longest matching prefix
+            known = 0
+            for message_id, message in zip(self._ids, history):
+                if message_id != id(message):
+                    break
+                known += 1
+            del self._ids[known:]
+            del self._prefix[known + 1:]
+            self._turn_starts = [i for i in self._turn_starts if i < known]
+            if self._summary_upto > known:
+                self._reset_summary()
+
+        for index in range(known, len(history)):
+            message = history[index]
+            self._ids.append(id(message))
+            self._prefix.append(self._prefix[-1] + message_tokens(message))
+            if message.get("role") == "user":
+                self._turn_starts.append(index)
+
+    def _choose_cut(self):
+        """Returns the index of the oldest message to send verbatim."""
+        if self.max_tokens is None or not self._turn_starts:
+            return 0
+        total = self._prefix[-1]
+        if self.system_tokens + total <= self.max_tokens:
+            return 0
+
+        budget = self.max_tokens - self.system_tokens - self._summary_limit() - MESSAGE_OVERHEAD_TOKENS
+        held = self._cut
+        if (self.cut_slack_tokens and held and held < len(self._ids) and self._starts_turn(held)
+                and total - self._prefix[held] <= budget + self.cut_slack_tokens):
+            return held
+        recent = self._turn_starts[-self.recent_turns:]
+        cut = recent[0]
+        for start in reversed(self._turn_starts[:-len(recent)]):
+            if total - self._prefix[start] > budget:
+                break
+            cut = start
+        return cut
+
+    def _starts_turn(self, index):
+        position = bisect.bisect_left(self._turn_starts, index)
+        return position < len(self._turn_starts) and self._turn_starts[position] == index
+
+    def _summarize(self, history, cut):
+        """Extends the cached summary with the messages in history[_summary_upto:cut]."""
+        if cut < self._summary_upto:
+            self._reset_summary()
+        for message in history[self._summary_upto:cut]:
+            text = " ".join(message_text(message).split())
+            if not text:
+                continue
+            if len(text) > SUMMARY_LINE_CHARS:
+                text = text[:SUMMARY_LINE_CHARS].rstrip() + "..."
+            line = f"{message.get('role', 'user')}: {text}"
+            self._summary_lines.append(line)
+            self._summary_tokens += estimate_tokens(line)
+        self._summary_upto = cut
+
+        # Keep the summary itself bounded: oldest lines fall off first
+        limit = self._summary_limit()
+        while len(self._summary_lines) > 1 and self._summary_tokens > limit:
+            self._summary_tokens -= estimate_tokens(self._summary_lines.pop(0))
+
+        text = SUMMARY_HEADER + "\n" + "\n".join(self._summary_lines)
+        return {"role": "user", "parts": [{"text": text}]}
+
+    def _summary_limit(self):
+        return max(64, (self.max_tokens or 0) // 8)
+
+    def _reset_summary(self):
+        self._summary_upto = 0
+        self._summary_lines = []
+        self._summary_tokens = 0
@@ -1,8 +1,21 @@
 # -*- mode: python ; coding: utf-8 -*-
+#
+# Default build: a single-file executable.
+#     pyinstaller gemini_chat.spec
+#
+# Fast-launch build: a onedir bundle without UPX. Nothing is unpacked to a
+# temporary directory and no DLL has to be decompressed on every launch.
+#     pyinstaller gemini_chat.spec -- --fast-launch
+
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--fast-launch', action='store_true')
+options = parser.parse_args()
 
 
 a = Analysis(
-    ['gemini_chat.py'],
+    ['gui_chat.py'],
     pathex=[],
     binaries=[],
     datas=[],
@@ -16,23 +29,51 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.datas,
-    [],
-    name='gemini_chat',
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=True,
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-)
+if options.fast_launch:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name='gemini_chat',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name='gemini_chat',
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.datas,
+        [],
+        name='gemini_chat',
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=True,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=True,
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
@@ -1,10 +1,25 @@
 import argparse
+import asyncio
+import signal
 from google import genai
 import os
+import sys
+import time
+from batch_runner import BatchRunner
+from chat_journal import MAX_TURNS, ChatJournal, journal_path_for
+from history_search import HistorySearch, format_hit
+from model_router import build_router
+from pipe_runner import PipeRunner
+from response_cache import CACHE_MODES, ResponseCache
+from retry_policy import RetryPolicy
+from turn_metrics import MetricsRegistry
+from chat_engine import (
+    ChatEngine, MODEL_AUTO, MODEL_FLASH, MODEL_PRO, TRUNCATED_MARKER, build_config, resolve_model_name
+)
 
-# Define constants
-MODEL_FLASH = 'gemini-2.5-flash'
-MODEL_PRO = 'gemini-2.5-pro'
+# The GUI's default history file; /search looks there when -f is not given
+LOG_FILE_NAME = "chat_history.json"
+HISTORY_TAIL_MESSAGES = 200
 
 class GeminiChat:
     """
@@ -18,21 +33,9 @@ class GeminiChat:
         # Parse command line arguments
         self.args = self._get_args()
         
-        # Normalize model name
-        if self.args.model.lower() == 'flash':
-            self.model_name = MODEL_FLASH
-        elif self.args.model.lower() == 'pro':
-            self.model_name = MODEL_PRO
-        else:
-            self.model_name = self.args.model
-            
-        # Initialize configuration and history
-        self.config = {"temperature": self.args.temperature}
-        
-        # Initialize history with system instruction if provided
-        self.history = []
-        if self.args.system:
-            self.config["system_instruction"] = self.args.system
+        # Normalize model name and build the generation config
+        self.model_name = resolve_model_name(self.args.model)
+        self.config = build_config(self.args.temperature, self.args.system)
         
         try:
             # Initialize the client (Encapsulation)
@@ -43,6 +46,37 @@ class GeminiChat:
             print("Error: Could not initialize Gemini Client.")
             print("Please check your GEMINI_API_KEY environment variable and network connection.")
             exit()
+        
+        # The async engine owns history and context selection; the CLI only renders its events
+        self.response_cache = ResponseCache(mode=self.args.cache) if self.args.cache != 'off' else None
+        self.metrics = MetricsRegistry(self.args.metrics_out)
+        # -m auto: each turn is routed between flash and pro
+        self.router = build_router(self.model_name, self.args)
+        # In batch mode every upstream request must pass the runner's rate buckets,
+        # so the engine makes a single attempt and BatchRunner does the retrying
+        retry = RetryPolicy(max_attempts=1) if self.args.batch else None
+        self.engine = ChatEngine(
+            self.client, self.model_name, self.config, self.args.max_context_tokens,
+            response_cache=self.response_cache,
+            context_caching=self.args.context_cache,
+            metrics=self.metrics,
+            router=self.router,
+            retry=retry,
+            image_count=self.args.images
+        )
+        # With -f, turns are journaled (and indexed for /search) and the recent history is resumed
+        self.journal = None
+        self.search = None
+        history = None
+        if self.args.file:
+            self.journal = ChatJournal(journal_path_for(self.args.file), max_turns=self.args.max_history_turns)
+            self.journal.import_json(self.args.file)
+            self.search = HistorySearch(self.journal)
+            _, history = self.journal.read_tail(HISTORY_TAIL_MESSAGES)
+        self.session = self.engine.session(history=history)
+        self.history = self.session.history
+        # Prompt of the last turn that failed (it is not in the history); resent by /retry
+        self.failed_prompt = None
 
     def _get_args(self):
         """Private method to set up and parse command-line arguments using argparse."""
@@ -53,8 +87,8 @@ class GeminiChat:
             '-m', '--model',
             type=str,
             default=MODEL_FLASH,
-            choices=[MODEL_FLASH, MODEL_PRO, 'flash', 'pro'],
-            help=f"Specify the Gemini model to use. Default: {MODEL_FLASH}"
+            choices=[MODEL_FLASH, MODEL_PRO, 'flash', 'pro', MODEL_AUTO],
+            help=f"Specify the Gemini model to use ('auto' routes each turn between flash and pro). Default: {MODEL_FLASH}"
         )
         parser.add_argument(
             '-t', '--temperature',
@@ -68,59 +102,301 @@ class GeminiChat:
             default=None,
             help="Set a system instruction to define the model's personality or role."
         )
+        parser.add_argument(
+            '-f', '--file',
+            type=str,
+            default=None,
+            help="Conversation history file to resume and append to (journaled as <name>.jsonl). Default: none."
+        )
+        parser.add_argument(
+            '--max-history-turns',
+            type=int,
+            default=MAX_TURNS,
+            help=f"Turns kept in the -f history journal; older ones are dropped as it is compacted (0 keeps all). Default: {MAX_TURNS}."
+        )
+        parser.add_argument(
+            '--max-context-tokens',
+            type=int,
+            default=None,
+            help="Token budget for the history sent on each turn. Older turns are summarized. Default: unlimited."
+        )
+        parser.add_argument(
+            '--cache',
+            type=str,
+            default='off',
+            choices=CACHE_MODES,
+            help="Local response cache for repeated identical turns (e.g. with -t 0). Default: off."
+        )
+        parser.add_argument(
+            '--context-cache',
+            action='store_true',
+            help="Keep the system instruction and older history in a server-side Gemini context cache."
+        )
+        parser.add_argument(
+            '--metrics-out',
+            type=str,
+            default=None,
+            metavar='FILE',
+            help="Export per-turn latency metrics: *.jsonl appends one record per turn, other names get Prometheus text."
+        )
+        parser.add_argument(
+            '--slo',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help="With -m auto: latency target per turn; pro is skipped while its recent turns are slower. Default: none."
+        )
+        parser.add_argument(
+            '--hedge-after',
+            type=float,
+            default=None,
+            metavar='SECONDS',
+            help="With -m auto: if pro has not started answering after this long, race it against flash. Default: off."
+        )
+        parser.add_argument(
+            '--route-log',
+            type=str,
+            default=None,
+            metavar='FILE',
+            help="With -m auto: append every routing decision and its outcome to this JSONL file."
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=1,
+            metavar='N',
+            help="Number of images generated per image request (requested in parallel). Default: 1."
+        )
+        parser.add_argument(
+            '--pipe',
+            action='store_true',
+            help="Read prompts from stdin and stream the bare answers to stdout (no banners or prompts). Use -f to keep history across runs."
+        )
+        parser.add_argument(
+            '-0', '--null',
+            action='store_true',
+            help="Pipe mode: prompts and answers are NUL-terminated instead of one per line (allows multi-line prompts)."
+        )
+        parser.add_argument(
+            '--ndjson',
+            action='store_true',
+            help="Pipe mode: write chunk/done/usage/error events as JSON lines instead of raw text."
+        )
+        parser.add_argument(
+            '--batch',
+            type=str,
+            default=None,
+            metavar='INPUT.jsonl',
+            help="Run prompts from a JSONL file ({\"id\": ..., \"prompt\": ...} per line) instead of chatting."
+        )
+        parser.add_argument(
+            '--out',
+            type=str,
+            default='results.jsonl',
+            help="Batch mode: file that results are appended to. Default: results.jsonl."
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help="Batch mode: number of requests in flight at once. Default: 4."
+        )
+        parser.add_argument(
+            '--rpm',
+            type=int,
+            default=None,
+            help="Batch mode: requests-per-minute limit. Default: unlimited."
+        )
+        parser.add_argument(
+            '--tpm',
+            type=int,
+            default=None,
+            help="Batch mode: tokens-per-minute limit. Default: unlimited."
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            default=None,
+            help="Batch mode: file of completed ids used to resume. Default: <out>.done."
+        )
         return parser.parse_args()
 
     def _print_initial_info(self):
         """Prints initial application setup details."""
+        if self.args.pipe:
+            return  # stdout carries only answers in pipe mode
         print("\n--- Gemini Chat CLI Initialized (OOP) ---")
         print(f"Model: {self.model_name}")
         print(f"Temperature: {self.args.temperature}")
         if self.args.system:
             print(f"System Role: {self.args.system[:50]}...")
         print("---")
-        print("Enter your prompt (type 'exit' or 'quit' to stop).")
+        if not self.args.batch:
+            print("Enter your prompt (type 'exit' or 'quit' to stop, '/stats' for latency statistics, '/search WORDS' to search history, '/retry' to resend a failed prompt).")
+
+    def run_batch(self):
+        """Runs every prompt in --batch concurrently and writes results to --out."""
+        runner = BatchRunner(
+            self,
+            self.args.out,
+            concurrency=self.args.concurrency,
+            rpm=self.args.rpm,
+            tpm=self.args.tpm,
+            checkpoint_path=self.args.checkpoint
+        )
+        asyncio.run(runner.run(self.args.batch))
+        self._print_cache_summary()
+
+    def run_pipe(self):
+        """Answers prompts from stdin until EOF; returns the exit status."""
+        runner = PipeRunner(self, null_delimited=self.args.null, ndjson=self.args.ndjson)
+        loop = asyncio.new_event_loop()
+        try:
+            return runner.run(loop)
+        finally:
+            loop.run_until_complete(self.engine.aclose())
+            loop.close()
+            if self.response_cache:
+                print(f"Response cache: {self.response_cache.summary()}", file=sys.stderr)
+                self.response_cache.close()
+
+    def _print_cache_summary(self):
+        if self.response_cache:
+            print(f"Response cache: {self.response_cache.summary()}")
+            self.response_cache.close()
 
     def start_chat(self):
         """Main loop to handle user input and stream responses."""
-        while True:
-            prompt = input('>>> ')
-
-            if prompt.lower() in ['exit', 'quit']:
-                print("\nExiting...")
-                print("To deactivate your virtual environment, run: deactivate")
-                break
-
-            # Add the new user message to the history
-            self.history.append({"role": "user", "parts": [{"text": prompt}]})
-
-            try:
-                print("-" * 30)
-                print("Gemini:", end=" ", flush=True) 
-                
-                # Call the streaming method with full history and configuration
-                response_stream = self.client.models.generate_content_stream(
-                    model=self.model_name,
-                    contents=self.history,
-                    config=self.config
-                )
-                
-                full_response = ""
-                # Stream and capture the full response
-                for chunk in response_stream:
-                    if chunk.text:
-                        print(chunk.text, end="", flush=True)
-                        full_response += chunk.text
-                
-                print("\n" + "-" * 30)
-                
-                # Add the model's full response to the history
-                self.history.append({"role": "model", "parts": [{"text": full_response}]})
-                
-            except Exception as e:
-                print(f"\nAn error occurred during generation: {e}")
-                print("If using 'pro', ensure you have access to that model.")
+        # One loop for the whole session: the async client's connections are bound to it
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    prompt = input('>>> ')
+                except (KeyboardInterrupt, EOFError):
+                    prompt = 'exit'
+
+                if prompt.lower() in ['exit', 'quit']:
+                    print("\nExiting...")
+                    print("To deactivate your virtual environment, run: deactivate")
+                    break
+                if prompt.strip() == '/stats':
+                    print(self.metrics.report())
+                    if self.router:
+                        print(self.router.summary())
+                    continue
+                command, _, query = prompt.strip().partition(' ')
+                if command == '/search':
+                    self._print_search(query)
+                    continue
+                if prompt.strip() == '/retry':
+                    if self.failed_prompt is None:
+                        print("Nothing to retry.")
+                        continue
+                    prompt = self.failed_prompt
+
+                self._run_interruptible(loop, self._stream_reply(prompt))
+        finally:
+            loop.run_until_complete(self.engine.aclose())
+            loop.close()
+            self._print_cache_summary()
+
+    def _print_search(self, query):
+        if not query.strip():
+            print("Usage: /search WORDS")
+            return
+        if self.search is None:
+            # No -f: search the GUI's history without journaling this session
+            journal_path = journal_path_for(LOG_FILE_NAME)
+            if not os.path.exists(journal_path):
+                print(f"No history to search ({journal_path} not found; use -f to pick a history file).")
+                return
+            # Read-only: the GUI may be writing to it, so never repair or truncate it from here
+            self.search = HistorySearch(ChatJournal(journal_path, read_only=True))
+        started = time.perf_counter()
+        self.search.sync()
+        hits = self.search.search(query)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"--- {len(hits)} results for '{query.strip()}' in {self.search.journal.path} ({elapsed_ms:.1f} ms) ---")
+        for hit in hits:
+            print(format_hit(hit))
+
+    def _record_turn(self, prompt, response_text):
+        if self.journal is None:
+            return
+        started = time.perf_counter()
+        try:
+            self.journal.append_turn([
+                {"role": "user", "parts": [{"text": prompt}]},
+                {"role": "model", "parts": [{"text": response_text}]},
+            ])
+        except Exception as e:
+            print(f"Error saving history: {e}")
+        self.metrics.observe("history_save_ms", (time.perf_counter() - started) * 1000)
+
+    def _run_interruptible(self, loop, coro):
+        """Runs one turn to completion; Ctrl-C stops the turn instead of exiting the program."""
+        task = loop.create_task(coro)
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.engine.cancel)
+            handler_installed = True
+        except (NotImplementedError, RuntimeError):
+            # No loop signal handlers (e.g. Windows): fall back to catching KeyboardInterrupt
+            handler_installed = False
+        try:
+            while True:
+                try:
+                    loop.run_until_complete(task)
+                    return
+                except KeyboardInterrupt:
+                    self.engine.cancel()
+        finally:
+            if handler_installed:
+                loop.remove_signal_handler(signal.SIGINT)
+
+    async def _stream_reply(self, prompt):
+        try:
+            print("-" * 30)
+            print("Gemini:", end=" ", flush=True) 
+            
+            # Stream the answer; the engine adds both messages to the history when the turn ends
+            self.failed_prompt = None
+            async for event in self.engine.stream_turn(prompt):
+                if event.kind == "text":
+                    print(event.data, end="", flush=True)
+                elif event.kind == "cancelled":
+                    print(TRUNCATED_MARKER, end="", flush=True)
+                    self._record_turn(prompt, event.data)
+                elif event.kind == "image_request":
+                    print(f"[Generating image: {event.data}]", flush=True)
+                elif event.kind == "images":
+                    for uri in event.data:
+                        print(uri)
+                    if not event.data:
+                        print("Sorry, I couldn't generate an image for that prompt.")
+                elif event.kind == "done":
+                    self._record_turn(prompt, event.data)
+            
+            print()
+            context = self.session.context
+            if context.last_saved_tokens:
+                print(f"[context: ~{context.last_sent_tokens} tokens sent, ~{context.last_saved_tokens} saved]")
+            if self.router and self.session.last_model:
+                print(f"[auto: answered by {self.session.last_model}]")
+            print("-" * 30)
+            
+        except Exception as e:
+            # The engine already retried and rolled the turn back, so the history has no orphaned prompt
+            self.failed_prompt = prompt
+            print(f"\nAn error occurred during generation: {e}")
+            print("If using 'pro', ensure you have access to that model. Type '/retry' to send the prompt again.")
 
 if __name__ == "__main__":
     # Create an instance of the class and start the chat
     chat_app = GeminiChat()
-    chat_app.start_chat()
\ No newline at end of file
+    if chat_app.args.batch:
+        chat_app.run_batch()
+    elif chat_app.args.pipe:
+        sys.exit(chat_app.run_pipe())
+    else:
+        chat_app.start_chat()
\ No newline at end of file
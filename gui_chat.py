@@ -1,24 +1,40 @@
 import argparse
+import asyncio
 import os
-import json
+import threading
 import tkinter as tk 
 from tkinter import scrolledtext, messagebox, filedialog
-from threading import Thread
-from google import genai
-from PIL import Image, ImageTk 
 from datetime import date 
-import requests 
-import io 
 import customtkinter as ctk 
+from chat_journal import MAX_TURNS, ChatJournal, journal_path_for
+from history_search import HistorySearch, format_hit
+from image_gallery import GALLERY_THUMB_WIDTH, ImageGallery
+from response_cache import CACHE_MODES, ResponseCache
+from chat_engine import (
+    ChatEngine, EngineLoop, MODEL_FLASH, TRUNCATED_MARKER, build_config, resolve_model_name
+)
+from model_router import build_router
+from stream_buffer import StreamBuffer, STREAM_TICK_MS
+from transcript_window import TranscriptWindow
+from turn_metrics import MetricsRegistry
+import itertools
+import shutil
+import time
+# google.genai, requests and image_cache/workers are imported by the warm-up
+# thread in _warm_up(), after the window is already on screen. PIL.Image is not
+# deferred: customtkinter imports it at module import, before the window exists.
 
 # --- CONFIGURATION CONSTANTS ---
-MODEL_FLASH = 'gemini-2.5-flash'
-MODEL_PRO = 'gemini-2.5-pro'
 FONT_SIZE = 14 
 LOGO_FILENAME = "gemini_logo.png" 
 LOG_FILE_NAME = "chat_history.json" 
+HISTORY_TAIL_MESSAGES = 200 
+LOGO_SIZE = 64 
 COPYRIGHT_TEXT = f"Gemini Chat GUI | © {date.today().year} Sayed Aliff" 
 MODEL_ROLE_NAME = "Terminal Guru" 
+DISPLAY_IMAGE_WIDTH = 500 
+SEARCH_DEBOUNCE_MS = 120 
+SEARCH_RESULT_ROWS = 10 
 
 class GeminiChat:
     
@@ -27,10 +43,13 @@ class GeminiChat:
         master.title("Gemini Chat GUI - CustomTkinter")
         
         # --- STATE VARIABLES ---
-        self.generated_image_data = None 
-        self.tk_image = None
-        # CRITICAL FIX: List to hold permanent references to images
+        # Ids of gallery slots; allocated on the engine thread, filled in on the UI thread
+        self._image_slots = itertools.count(1)
+        # Open preview windows and their images (kept referenced while shown)
         self.image_references = [] 
+        # Streamed text waiting for the next UI tick
+        self.stream_buffer = StreamBuffer()
+        self._stream_tick_id = None
         
         # --- INITIALIZATION LOGIC ---
         self.args = self._get_args() 
@@ -40,21 +59,31 @@ class GeminiChat:
             master.destroy()
             return
 
-        self.model_name = self.args.model if self.args.model.lower() not in ['flash', 'pro'] else (MODEL_FLASH if self.args.model.lower() == 'flash' else MODEL_PRO)
-        self.config = {"temperature": self.args.temperature}
-        
-        if self.args.system:
-            self.config["system_instruction"] = self.args.system
-            
+        self.model_name = resolve_model_name(self.args.model)
+        self.config = build_config(self.args.temperature, self.args.system)
         self.history_file = self.args.file if self.args.file else LOG_FILE_NAME
-        self.history = self._load_history()
+        self.metrics = MetricsRegistry(self.args.metrics_out)
+        self.router = build_router(self.model_name, self.args)
+
+        # Filled in by the warm-up thread; _ready is set once it has finished (or failed)
+        self.journal = None
+        self.search = None
+        self._journal_cursor = 0
+        self._journal_removed = 0
+        self.history = []
+        self.image_cache = None
+        self.pool_metrics = None
+        self.workers = None
+        self.http = None
+        self.client = None
+        self.response_cache = None
+        self.engine = None
+        self.session = None
+        self._ready = threading.Event()
         
-        try:
-            self.client = genai.Client()
-        except Exception:
-            messagebox.showerror("API Error", "Could not initialize Gemini Client. Check network/key validity.")
-            master.destroy()
-            return
+        # Chat turns run on the async engine in a background event-loop thread
+        self.engine_loop = EngineLoop()
+        self._turn_future = None
             
         # --- GUI SETUP ---
         master.grid_columnconfigure(0, weight=1)
@@ -62,7 +91,7 @@ class GeminiChat:
 
         # 1. Logo Display Area (Row 0)
         self.logo_label = ctk.CTkLabel(master, text="") 
-        self.logo_label.grid(row=0, column=0, columnspan=2, pady=(10, 0), sticky="n") 
+        self.logo_label.grid(row=0, column=0, columnspan=3, pady=(10, 0), sticky="n") 
         
         # 2. Output/Display Area (Scrolled Text) - Row 1 (Text view)
         self.chat_display = scrolledtext.ScrolledText(
@@ -73,42 +102,56 @@ class GeminiChat:
             bg='#242424', 
             fg='#DCE4EE' 
         )
-        self.chat_display.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
-
-        # 3. Image Display Area (NEW FRAME) - Row 1 (Image view, initially hidden)
-        self.image_frame = ctk.CTkFrame(master, border_width=2) 
-        self.image_frame.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
-        self.image_frame.grid_remove() 
-        
-        self.image_label = ctk.CTkLabel(self.image_frame, text="") 
-        self.image_label.pack(side=tk.TOP, padx=5, pady=5)
-        
-        self.download_button = ctk.CTkButton( 
-            self.image_frame, 
-            text="ছবিটি ডাউনলোড করুন", 
-            command=self.download_image, 
-            font=('Arial', 12)
-        )
-        self.download_button.pack(side=tk.BOTTOM, pady=10)
+        self.chat_display.grid(row=1, column=0, columnspan=3, padx=10, pady=10, sticky="nsew")
+        # Only the newest messages stay rendered; older ones are paged in on scroll-up
+        self.transcript = TranscriptWindow(self.chat_display, load_older=self._load_older_messages)
+
+        # 3. Image Gallery - Row 2 (thumbnail strip under the transcript, hidden until the first image)
+        self.gallery = ImageGallery(master, on_open=self._open_image, on_save=self.save_images)
+        self.gallery.frame.grid(row=2, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+        self.gallery.hide()
         
-        # 4. Input Field (Row 2)
+        # 4. Input Field (Row 3)
         self.input_field = ctk.CTkEntry(master, font=('Arial', FONT_SIZE)) 
-        self.input_field.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="ew")
+        self.input_field.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="ew")
         self.input_field.bind("<Return>", lambda event: self.send_message_thread())
         
-        # 5. Send Button (Row 2)
+        # 5. Send Button (Row 3)
         self.send_button = ctk.CTkButton(master, text="Send", command=self.send_message_thread, font=('Arial', 12)) 
-        self.send_button.grid(row=2, column=1, padx=(0, 10), pady=(0, 10), sticky="e")
+        self.send_button.grid(row=3, column=1, padx=(0, 10), pady=(0, 10), sticky="e")
         
-        # 6. Footer/Copyright Label (Row 3)
-        self.footer_label = ctk.CTkLabel(master, text=COPYRIGHT_TEXT, font=('Arial', 8), text_color='gray') 
-        self.footer_label.grid(row=3, column=0, columnspan=2, pady=(0, 5), sticky="s") 
+        # 5b. Stop Button (Row 3) - aborts the answer that is currently streaming
+        self.stop_button = ctk.CTkButton(master, text="Stop", command=self.stop_generation, font=('Arial', 12), state=tk.DISABLED, width=60) 
+        self.stop_button.grid(row=3, column=2, padx=(0, 10), pady=(0, 10), sticky="e")
         
-        self._set_window_icon()
-        self._load_logo()
+        # 6. Footer/Copyright Label (Row 4)
+        self.footer_label = ctk.CTkLabel(master, text=COPYRIGHT_TEXT, font=('Arial', 8), text_color='gray') 
+        self.footer_label.grid(row=4, column=0, columnspan=3, pady=(0, 5), sticky="s") 
+
+        # 7. History Search (top right) - ranked hits drop down below the box while typing
+        self.search_field = ctk.CTkEntry(master, placeholder_text="Search history", width=220, font=('Arial', 12))
+        self.search_field.place(relx=1.0, x=-10, y=10, anchor="ne")
+        self.search_field.bind("<KeyRelease>", self._on_search_key)
+        self.search_field.bind("<Escape>", lambda event: self._clear_search())
+        self.search_results = tk.Listbox(
+            master, 
+            height=SEARCH_RESULT_ROWS, 
+            font=('Arial', FONT_SIZE - 2), 
+            bg='#2b2b2b', 
+            fg='#DCE4EE', 
+            selectbackground='#1f6aa5', 
+            activestyle='none'
+        )
+        self.search_results.bind("<<ListboxSelect>>", self._on_search_select)
+        self._search_hits = []
+        self._search_after_id = None
         
         self.print_initial_info()
 
+        # Everything not needed to draw the window and type a prompt loads in the background,
+        # started from the main loop so the warm-up thread never touches Tk before it runs
+        master.after(0, lambda: threading.Thread(target=self._warm_up, name="gui-warm-up", daemon=True).start())
+
     # --- CORE METHODS ---
 
     def _get_args(self):
@@ -117,6 +160,15 @@ class GeminiChat:
         parser.add_argument('-t', '--temperature', type=float, default=0.5)
         parser.add_argument('-s', '--system', type=str, default=None)
         parser.add_argument('-f', '--file', type=str, default=None)
+        parser.add_argument('--max-history-turns', type=int, default=MAX_TURNS)
+        parser.add_argument('--max-context-tokens', type=int, default=None)
+        parser.add_argument('--cache', type=str, default='off', choices=CACHE_MODES)
+        parser.add_argument('--context-cache', action='store_true')
+        parser.add_argument('--metrics-out', type=str, default=None)
+        parser.add_argument('--slo', type=float, default=None)
+        parser.add_argument('--hedge-after', type=float, default=None)
+        parser.add_argument('--route-log', type=str, default=None)
+        parser.add_argument('--images', type=int, default=1)
         
         try:
             return parser.parse_known_args()[0]
@@ -124,43 +176,167 @@ class GeminiChat:
             return parser.parse_args([])
 
     def _load_history(self):
-        if self.history_file and os.path.exists(self.history_file):
+        migrated = self.journal.import_json(self.history_file)
+        if migrated:
+            print(f"Migrated {migrated} messages from {self.history_file} to {self.journal.path}")
+
+        # Everything before this offset is from earlier sessions and is paged in on scroll-up
+        self._journal_cursor = self.journal.end_offset()
+        self._journal_removed = self.journal.removed_bytes
+        _, data = self.journal.read_tail(HISTORY_TAIL_MESSAGES)
+        if data:
+            print(f"Loaded {len(data)} previous messages from {self.journal.path}")
+        return data
+
+    def _warm_up(self):
+        """
+        Start-up work that does not need the UI thread: history, the genai client
+        and engine, the image/HTTP stack and the logo. The window already accepts
+        input meanwhile; a prompt sent early waits for _ready in process_api_call.
+        """
+        try:
+            # Compaction runs inside append_turn, which _record_turn calls off the Tk thread
+            self.journal = ChatJournal(journal_path_for(self.history_file), max_turns=self.args.max_history_turns)
+            self.history = self._load_history()
+            self.search = HistorySearch(self.journal)
+
+            from google import genai
             try:
-                with open(self.history_file, 'r') as f:
-                    data = json.load(f)
-                    print(f"Loaded {len(data)} previous messages from {self.history_file}")
-                    return data
-            except json.JSONDecodeError:
-                return []
-        return []
-
-    def _save_history(self):
-        if self.history_file:
+                self.client = genai.Client()
+            except Exception:
+                self.master.after(0, self._on_client_error)
+                return
+
+            self.response_cache = ResponseCache(mode=self.args.cache) if self.args.cache != 'off' else None
+            self.engine = ChatEngine(
+                self.client, self.model_name, self.config, self.args.max_context_tokens,
+                response_cache=self.response_cache,
+                context_caching=self.args.context_cache,
+                metrics=self.metrics,
+                router=self.router,
+                image_count=self.args.images
+            )
+            self.session = self.engine.session(self.history_file, history=self.history)
+
+            # Shared bounded worker pool (image downloads/decoding) and keep-alive HTTP session
+            from image_cache import ImageCache
+            from workers import PoolMetrics, WorkerPool, pooled_session
+            self.image_cache = ImageCache()
+            self.pool_metrics = PoolMetrics()
+            self.workers = WorkerPool(metrics=self.pool_metrics)
+            self.http = pooled_session(self.pool_metrics)
+
+            self._prepare_logo()
+            self.master.after(0, self._on_ready)
+        except Exception as e:
+            print(f"Error during start-up: {e}")
+            self.master.after(0, self.append_to_chat, "Error", f"Start-up failed: {e}")
+            return
+        finally:
+            self._ready.set()
+
+        # Index turns the search sidecar has not seen yet (all of them on first use)
+        try:
+            added = self.search.sync()
+            if added:
+                print(f"Indexed {added} turns for search in {self.search.path}")
+        except Exception as e:
+            print(f"Error building search index: {e}")
+
+    def _on_ready(self):
+        if self.history:
+            self.append_to_chat("System", "Loaded previous session. Continue chatting...")
+        else:
+            self.append_to_chat("System", "Start chatting below...")
+
+    def _on_client_error(self):
+        messagebox.showerror("API Error", "Could not initialize Gemini Client. Check network/key validity.")
+        self.master.destroy()
+
+    def _load_older_messages(self, count):
+        # Compaction only drops the oldest turns, so the cursor moves back by what it removed
+        removed = self.journal.removed_bytes
+        self._journal_cursor = max(0, self._journal_cursor - (removed - self._journal_removed))
+        self._journal_removed = removed
+        if self._journal_cursor <= 0:
+            return []
+        self._journal_cursor, messages = self.journal.read_tail(count, end=self._journal_cursor)
+        blocks = []
+        for message in messages:
+            text = "".join(part.get("text") or "" for part in message.get("parts", []))
+            if message.get("role") == "user":
+                blocks.append(("user", "User", text))
+            else:
+                blocks.append(("model", MODEL_ROLE_NAME, text))
+        return blocks
+
+    def shutdown(self):
+        """Stops background work and releases pooled connections (called from on_closing)."""
+        self._ready.wait(timeout=5)
+        self._drain_turn()
+        if self.engine is not None:
             try:
-                with open(self.history_file, 'w') as f:
-                    if self.history:
-                        json.dump(self.history, f, indent=4)
-                        print(f"History saved to {self.history_file}")
+                self.engine_loop.submit(self.engine.aclose()).result(timeout=5)
             except Exception as e:
-                print(f"Error saving history: {e}")
+                print(f"Error releasing context caches: {e}")
+        self.engine_loop.stop()
+        if self.workers is not None:
+            self.workers.shutdown(wait=False)
+            self.http.close()
+            print(f"Worker pool: {self.pool_metrics.summary()}")
+        if self.image_cache is not None:
+            self.image_cache.flush()
+        if self.response_cache:
+            print(f"Response cache: {self.response_cache.summary()}")
+            self.response_cache.close()
+        if self.search is not None:
+            self.search.close()
+
+    def _drain_turn(self, timeout=5):
+        """Stops a turn that is still running and waits until it is journaled, keeping Tk responsive meanwhile."""
+        future = self._turn_future
+        if future is None or future.done():
+            return
+        self.engine_loop.call(self._cancel_turn)
+        deadline = time.monotonic() + timeout
+        while not future.done() and time.monotonic() < deadline:
+            # The turn hands its last UI updates to Tk; run them so it can finish
+            self.master.update()
+            time.sleep(0.01)
+
+    def _record_turn(self, prompt, response_text):
+        started = time.perf_counter()
+        try:
+            self.journal.append_turn([
+                {"role": "user", "parts": [{"text": prompt}]},
+                {"role": "model", "parts": [{"text": response_text}]},
+            ])
+        except Exception as e:
+            print(f"Error saving history: {e}")
+        self.metrics.observe("history_save_ms", (time.perf_counter() - started) * 1000)
 
-    def _set_window_icon(self):
+    def _prepare_logo(self):
+        # Warm-up thread: decode and shrink the full-size logo once, off the UI thread
         try:
-            icon_image = Image.open(LOGO_FILENAME)
-            photo = ImageTk.PhotoImage(icon_image)
-            self.master.iconphoto(False, photo)
+            from PIL import Image
+            img = Image.open(LOGO_FILENAME)
+            img.thumbnail((LOGO_SIZE, LOGO_SIZE))
+        except Exception as e:
+            print(f"DEBUG: Logo display failed: {e}") 
+            return
+        self.master.after(0, self._show_logo, img)
+
+    def _show_logo(self, img):
+        from PIL import ImageTk
+        try:
+            self.master.iconphoto(False, ImageTk.PhotoImage(img))
         except Exception:
             pass
-
-    def _load_logo(self):
         try:
-            logo_path = LOGO_FILENAME
-            img = Image.open(logo_path)
-            self.logo_photo = ctk.CTkImage(light_image=img, dark_image=img, size=(64, 64))
+            self.logo_photo = ctk.CTkImage(light_image=img, dark_image=img, size=(LOGO_SIZE, LOGO_SIZE))
             self.logo_label.configure(image=self.logo_photo, text="")
         except Exception as e:
             print(f"DEBUG: Logo display failed: {e}") 
-            pass 
 
     def print_initial_info(self):
         info = f"--- Gemini Chat GUI Initialized ---\n"
@@ -169,202 +345,285 @@ class GeminiChat:
         if self.args.system:
             info += f"System Role: {self.args.system[:50]}...\n"
         info += f"--------------------------------------\n"
-        if self.history:
-             info += "Loaded previous session. Continue chatting...\n"
-        else:
-             info += "Start chatting below...\n"
 
         self.append_to_chat("System", info)
 
     def append_to_chat(self, role, text, is_image_request=False):
-        self.chat_display.config(state='normal')
-        
         tag = role.lower()
         if role == "System": tag = "system_info"
         if is_image_request: tag = "image_info"
         
         display_role = MODEL_ROLE_NAME if role == "Gemini" else role
 
-        self.chat_display.insert(tk.END, f"{display_role}: ", (tag,))
-        self.chat_display.insert(tk.END, text + "\n\n")
-        self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
-        
-        if not is_image_request:
-            self.image_frame.grid_remove()
-            self.chat_display.grid() 
+        self.transcript.add_block(tag, display_role, text)
 
 
     def send_message_thread(self):
         prompt = self.input_field.get()
         if not prompt.strip(): return
+        if self.send_button.cget("state") == tk.DISABLED: return
 
         self.input_field.delete(0, tk.END)
+        if prompt.strip() == "/stats":
+            report = self.metrics.report()
+            if self.router:
+                report += "\n" + self.router.summary()
+            self.append_to_chat("System", report)
+            return
+        command, _, query = prompt.strip().partition(" ")
+        if command == "/search":
+            hits = self.search.search(query) if self.search is not None else []
+            lines = [f"{len(hits)} results for '{query.strip()}'"] + [format_hit(hit) for hit in hits]
+            self.append_to_chat("System", "\n".join(lines))
+            return
+
         self.send_button.configure(state=tk.DISABLED) 
+        self.stop_button.configure(state=tk.NORMAL)
         self.append_to_chat("User", prompt)
         
-        thread = Thread(target=self.process_api_call, args=(prompt,))
-        thread.start()
+        self._turn_future = self.engine_loop.submit(self.process_api_call(prompt))
 
-    # --- IMAGE HANDLING LOGIC (FINAL CALIBRATION) ---
+    # --- HISTORY SEARCH ---
 
-    def _display_image_from_url(self, url, prompt_text):
-        """Downloads the image from URL and displays it in the dedicated frame (called from background thread)."""
-        
-        def download_and_display_task():
-            """Function to run safely in a dedicated thread."""
+    def _on_search_key(self, event):
+        if event.keysym == "Escape":
+            return
+        # Debounced: one query per pause in typing rather than one per key
+        if self._search_after_id is not None:
+            self.master.after_cancel(self._search_after_id)
+        self._search_after_id = self.master.after(SEARCH_DEBOUNCE_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_after_id = None
+        query = self.search_field.get()
+        self._search_hits = self.search.search(query) if self.search is not None and query.strip() else []
+        self.search_results.delete(0, tk.END)
+        if not query.strip():
+            self.search_results.place_forget()
+            return
+        for hit in self._search_hits:
+            self.search_results.insert(tk.END, format_hit(hit))
+        if not self._search_hits:
+            self.search_results.insert(tk.END, "No matches")
+        self.search_results.place(in_=self.search_field, relx=1.0, rely=1.0, y=4, anchor="ne", width=560)
+        self.search_results.lift()
+
+    def _on_search_select(self, event):
+        selection = self.search_results.curselection()
+        if not selection or selection[0] >= len(self._search_hits):
+            return
+        hit = self._search_hits[selection[0]]
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(hit.ts)) if hit.ts else "unknown date"
+        role = "User" if hit.role == "user" else MODEL_ROLE_NAME
+        self.append_to_chat("System", f"Search result ({role}, {when}):\n{self.search.message(hit.rowid)}")
+        self._clear_search()
+
+    def _clear_search(self):
+        self.search_field.delete(0, tk.END)
+        self.search_results.delete(0, tk.END)
+        self.search_results.place_forget()
+        self._search_hits = []
+
+    def stop_generation(self):
+        """Stops the streaming answer; the engine closes the upstream request right away."""
+        self.stop_button.configure(state=tk.DISABLED)
+        self.engine_loop.call(self._cancel_turn)
+
+    def _cancel_turn(self):
+        # Engine loop thread. A turn still waiting for start-up has not reached the engine yet.
+        if self.session is not None and self.engine.is_busy(self.session.session_id):
+            self.engine.cancel(self.session.session_id)
+        elif self._turn_future is not None:
+            self._turn_future.cancel()
+
+    def _enable_input(self):
+        self.send_button.configure(state=tk.NORMAL)
+        self.stop_button.configure(state=tk.DISABLED)
+
+    def _restore_prompt(self, prompt):
+        if not self.input_field.get():
+            self.input_field.insert(0, prompt)
+
+    # --- IMAGE HANDLING LOGIC (GALLERY) ---
+
+    def _display_images(self, urls, prompt_text):
+        """
+        Adds a gallery slot per URL and downloads/decodes the images concurrently on the
+        worker pool; each one is shown as soon as it is ready (called from the engine thread).
+        """
+        for url in urls:
+            slot_id = next(self._image_slots)
+            self.master.after(0, self.gallery.add_slot, slot_id, prompt_text)
             try:
-                # 1. DOWNLOAD IMAGE (Heavy task)
-                response = requests.get(url, timeout=60) 
-                response.raise_for_status() 
-                
-                image_data = io.BytesIO(response.content)
-                img = Image.open(image_data)
-                self.generated_image_data = img 
-                
-                # Resize image
-                width, height = img.size
-                if width > 500:
-                    new_width = 500
-                    new_height = int(new_width * height / width)
-                    img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=(new_width, new_height))
-                self.tk_image = ctk_image
-                
-                # 2. Trigger SAFE GUI update on the main thread
-                self.master.after(0, self._show_image_on_gui, prompt_text)
-
-            except requests.exceptions.RequestException as e:
-                print(f"DEBUG ERROR: Failed to download image (Network): {e}") 
-                self.master.after(0, self.append_to_chat, "Error", f"ছবি ডাউনলোড করা যায়নি। নেটওয়ার্ক চেক করুন। Error: {e}")
-                self.master.after(0, self.chat_display.grid) 
-            except Exception as e:
-                print(f"DEBUG ERROR: Error displaying image (PIL/TK): {e}")
-                self.master.after(0, self.append_to_chat, "Error", f"ছবি প্রদর্শনে ত্রুটি। ফাইল ফরম্যাট/সাইজ সমস্যা। Error: {e}")
-                self.master.after(0, self.chat_display.grid) 
-            finally:
-                 self.master.after(0, lambda: self.send_button.configure(state=tk.NORMAL))
+                self.workers.submit(self._load_gallery_image, slot_id, url)
+            except RuntimeError as e:
+                self.master.after(0, self.gallery.fail, slot_id, str(e))
 
-        Thread(target=download_and_display_task).start()
-
-    def _show_image_on_gui(self, prompt_text):
-        """Helper function to perform actual GUI update on the main thread."""
+    def _load_gallery_image(self, slot_id, url):
+        """Worker thread: download (or cache hit), decode and scale, then hand the result to Tk."""
+        import requests  # already loaded by the warm-up thread
         try:
-            # FIX: Clear all text before switching to image view
-            self.chat_display.config(state='normal')
-            self.chat_display.delete('1.0', tk.END) 
-            self.chat_display.config(state='disabled')
-            
-            # CRITICAL FIX: Save the reference globally to prevent garbage collection
-            self.image_label.configure(image=self.tk_image, text="")
-            self.image_label.image = self.tk_image # Manually holding the reference
-
-            self.chat_display.grid_remove() # Hide text display
-            self.image_frame.grid()       # Show image frame
-            
-            self.append_to_chat("Gemini", f"Image generated: {prompt_text}", is_image_request=True)
-            self.send_button.configure(state=tk.NORMAL)
-            self.input_field.focus_set()
+            key = self.image_cache.fetch(url, self._download_image_bytes)
+            img = self.image_cache.thumbnail(key, GALLERY_THUMB_WIDTH)
+            img.load()  # decode here rather than when Tk first draws it
+            ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+            self.master.after(0, self._show_gallery_image, slot_id, ctk_image, key)
+        except requests.exceptions.RequestException as e:
+            print(f"DEBUG ERROR: Failed to download image (Network): {e}") 
+            self.master.after(0, self.gallery.fail, slot_id, f"ছবি ডাউনলোড করা যায়নি। নেটওয়ার্ক চেক করুন। Error: {e}")
         except Exception as e:
-            print(f"DEBUG ERROR: Error in _show_image_on_gui: {e}")
-            self.append_to_chat("Error", f"GUI আপডেট করতে সমস্যা হয়েছে: {e}")
-            self.chat_display.grid() 
-            self.send_button.configure(state=tk.NORMAL)
-
-
-    def download_image(self):
-        if self.generated_image_data:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png"), ("All files", "*.*")],
-                initialfile="generated_image.png"
-            )
-            if file_path:
-                try:
-                    self.generated_image_data.save(file_path)
-                    messagebox.showinfo("Success", f"Image successfully saved to:\n{file_path}")
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to save image: {e}")
-        else:
-            messagebox.showwarning("Warning", "No image currently available to download.")
+            print(f"DEBUG ERROR: Error displaying image (PIL/TK): {e}")
+            self.master.after(0, self.gallery.fail, slot_id, f"ছবি প্রদর্শনে ত্রুটি। ফাইল ফরম্যাট/সাইজ সমস্যা। Error: {e}")
 
+    def _download_image_bytes(self, url):
+        response = self.http.get(url, timeout=60) 
+        response.raise_for_status() 
+        return response.content
 
-    def process_api_call(self, prompt):
-        
-        self.history.append({"role": "user", "parts": [{"text": prompt}]})
+    def _show_gallery_image(self, slot_id, ctk_image, key):
+        self.gallery.fill(slot_id, ctk_image, key)
+
+    def _open_image(self, key):
+        """Thumbnail clicked: loads a larger version on the worker pool, then opens it in a window."""
+        def load_preview():
+            try:
+                img = self.image_cache.thumbnail(key, DISPLAY_IMAGE_WIDTH)
+                img.load()
+                ctk_image = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
+                self.master.after(0, self._show_preview, ctk_image)
+            except Exception as e:
+                print(f"DEBUG ERROR: Error opening image preview: {e}")
 
+        try:
+            self.workers.submit(load_preview)
+        except RuntimeError as e:
+            # Queue full (many downloads still running) or shutting down
+            messagebox.showwarning("Busy", f"Could not open the image right now: {e}")
+
+    def _show_preview(self, ctk_image):
+        window = ctk.CTkToplevel(self.master)
+        window.title("Generated image")
+        label = ctk.CTkLabel(window, image=ctk_image, text="")
+        label.pack(padx=10, pady=10)
+        self.image_references.append(ctk_image)
+        window.protocol("WM_DELETE_WINDOW", lambda: (self.image_references.remove(ctk_image), window.destroy()))
+
+    def save_images(self):
+        """Copies every image in the gallery (original bytes, no re-encode) into a chosen folder."""
+        keys = self.gallery.keys()
+        if not keys:
+            messagebox.showwarning("Warning", "No image currently available to download.")
+            return
+        directory = filedialog.askdirectory(title="Save generated images to")
+        if not directory:
+            return
+        saved = 0
+        try:
+            for number, key in enumerate(keys, 1):
+                file_name = f"generated_image_{number:02d}_{key[:8]}{self.image_cache.extension(key)}"
+                shutil.copyfile(self.image_cache.original_path(key), os.path.join(directory, file_name))
+                saved += 1
+            messagebox.showinfo("Success", f"{saved} images successfully saved to:\n{directory}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save images ({saved} of {len(keys)} saved): {e}")
+
+
+    async def process_api_call(self, prompt):
+        """Runs one turn on the engine loop; UI updates are handed to Tk via master.after."""
+        if not self._ready.is_set():
+            # Sent while still starting up: wait for the warm-up thread instead of dropping the prompt
+            try:
+                await asyncio.to_thread(self._ready.wait)
+            except asyncio.CancelledError:
+                # Stopped before start-up finished; the prompt was never sent
+                self.master.after(0, self._restore_prompt, prompt)
+                self.master.after(0, self._enable_input)
+                raise
+        if self.engine is None:
+            self.master.after(0, self._enable_input)
+            return
         try:
             self.master.after(0, self._prepare_stream)
             
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=self.history,
-                config=self.config
-            )
-            
-            if response.function_calls and response.function_calls[0].name == 'image_generation:generate_images':
-                
-                prompt_text = response.function_calls[0].args['prompts'][0]
-
-                image_result = self.client.models.generate_images(
-                    model='imagen-3.0-generate-002', 
-                    prompt=prompt_text,
-                    config={'number_of_images': 1}
-                )
-
-                if image_result.generated_images:
-                    image_url = image_result.generated_images[0].uri
-                    self._display_image_from_url(image_url, prompt_text)
-                    self.history.append({"role": "model", "parts": [{"text": f"Generated image for: {prompt_text}"}]})
-                else:
-                    self.master.after(0, self.append_to_chat, "Gemini", "Sorry, I couldn't generate an image for that prompt.")
-                
-                return 
-
-            # Handle Standard Text Response (Streaming)
-            response_stream = self.client.models.generate_content_stream(
-                model=self.model_name,
-                contents=self.history,
-                config=self.config
-            )
+            image_prompt = None
+            async for event in self.engine.stream_turn(prompt, session_id=self.session.session_id):
+                if event.kind == "text":
+                    self.stream_buffer.append(event.data)
+                elif event.kind == "cancelled":
+                    if image_prompt is None:
+                        self.stream_buffer.append(TRUNCATED_MARKER)
+                    self.master.after(0, self._finalize_response, event.data)
+                    await asyncio.to_thread(self._record_turn, prompt, event.data)
+                elif event.kind == "image_request":
+                    image_prompt = event.data
+                    self.master.after(0, self._stop_stream)
+                elif event.kind == "images":
+                    if event.data:
+                        # Further batches may follow; the images fill in while the turn goes on
+                        self._display_images(event.data, image_prompt)
+                    else:
+                        self.master.after(0, self.append_to_chat, "Gemini", "Sorry, I couldn't generate an image for that prompt.")
+                        self.master.after(0, self._enable_input)
+                elif event.kind == "done":
+                    # fsync off the event loop so other sessions keep streaming
+                    await asyncio.to_thread(self._record_turn, prompt, event.data)
+                    if image_prompt is None:
+                        self.master.after(0, self._finalize_response, event.data)
+                    else:
+                        self.master.after(0, self.append_to_chat, "Gemini", event.data, True)
+                        self.master.after(0, self._finalize_response, None)
             
-            full_response = ""
-            for chunk in response_stream:
-                if chunk.text:
-                    self.master.after(0, self._stream_update, chunk.text)
-                    full_response += chunk.text
-            
-            self.master.after(0, self._finalize_response, full_response)
-
+            context = self.session.context
+            if context.last_saved_tokens:
+                print(f"Context: ~{context.last_sent_tokens} tokens sent, ~{context.last_saved_tokens} saved")
+            if self.router and self.session.last_model:
+                print(f"Auto: answered by {self.session.last_model}")
+
+        except asyncio.CancelledError:
+            # Stopped outside the stream (e.g. while saving or before it started)
+            self.master.after(0, self._finalize_response, None)
         except Exception as e:
+            # The engine already retried and rolled the turn back; hand the prompt back for resending
             error_msg = f"API Error: {e}"
+            self.master.after(0, self._stop_stream)
             self.master.after(0, self.append_to_chat, "Error", error_msg)
-            self.master.after(0, lambda: self.send_button.configure(state=tk.NORMAL))
+            self.master.after(0, self._restore_prompt, prompt)
+            self.master.after(0, self._enable_input)
 
 
     # --- STREAMING/GUI METHODS ---
 
     def _prepare_stream(self):
-        self.chat_display.config(state='normal')
-        self.chat_display.insert(tk.END, f"{MODEL_ROLE_NAME}: ", ('model',))
-        self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
+        self._stop_stream()
+        self.transcript.start_block('model', MODEL_ROLE_NAME)
+        self._stream_tick()
+
+    def _stream_tick(self):
+        """Periodic UI tick: inserts everything the worker streamed since the last tick."""
+        self._drain_stream()
+        self._stream_tick_id = self.master.after(STREAM_TICK_MS, self._stream_tick)
+
+    def _stop_stream(self):
+        """Cancels the UI tick, flushes any text still waiting in the buffer and closes the block."""
+        if self._stream_tick_id is not None:
+            self.master.after_cancel(self._stream_tick_id)
+            self._stream_tick_id = None
+        self._drain_stream()
+        self.transcript.finish_block()
+
+    def _drain_stream(self):
+        text = self.stream_buffer.drain()
+        if text:
+            self.metrics.observe("ui_dispatch_lag_ms", self.stream_buffer.last_lag * 1000)
+            self._stream_update(text)
         
     def _stream_update(self, text):
-        self.chat_display.config(state='normal')
-        self.chat_display.insert(tk.END, text)
-        self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
+        self.transcript.stream(text)
 
     def _finalize_response(self, full_response):
-        self.chat_display.config(state='normal')
-        self.chat_display.insert(tk.END, "\n\n")
-        self.chat_display.config(state='disabled')
+        self._stop_stream()
         
-        self.history.append({"role": "model", "parts": [{"text": full_response}]})
-        
-        self.send_button.configure(state=tk.NORMAL)
+        self._enable_input()
         self.input_field.focus_set()
 
 
@@ -384,7 +643,8 @@ def main():
     app.chat_display.tag_config('image_info', foreground='#9400D3', font=('Arial', FONT_SIZE, 'bold')) 
     
     def on_closing():
-        app._save_history()
+        # Turns are journaled as they complete; shutting down stops one still streaming and journals it truncated
+        app.shutdown()
         root.destroy()
         
     root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from context_window import message_text
+
+SEARCH_SUFFIX = ".search.sqlite3"
+SEARCH_LIMIT = 20
+SNIPPET_TOKENS = 12
+SYNC_BATCH_TURNS = 500
+
+SearchHit = namedtuple("SearchHit", ["rowid", "role", "ts", "snippet", "score"])
+
+
+def search_path_for(journal_path):
+    """Maps a journal file name (e.g. chat_history.jsonl) to its search index file name."""
+    root, _ = os.path.splitext(journal_path)
+    return root + SEARCH_SUFFIX
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, the last one as
+    a prefix (so results update while typing). Quoting keeps FTS5 operators
+    and punctuation in user input from being parsed as syntax.
+    """
+    words = [word.replace('"', '""') for word in query.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def format_hit(hit):
+    when = time.strftime("%Y-%m-%d %H:%M", time.localtime(hit.ts)) if hit.ts else "-"
+    snippet = " ".join(hit.snippet.split())
+    return f"{when}  {hit.role:<5}  {snippet}"
+
+
+class HistorySearch:
+    """
+    SQLite FTS5 sidecar index over a ChatJournal.
+
+    The index attaches itself to the journal: every appended turn is indexed
+    right away, and compaction keeps the indexed byte offset in step. sync()
+    catches up on turns the index has not seen (first use on an existing
+    journal, or a crash between the journal write and the index write) by
+    streaming the journal from the last indexed offset, so the history is
+    never loaded into memory as a whole.
+    """
+
+    def __init__(self, journal, path=None):
+        self.journal = journal
+        self.path = path or search_path_for(journal.path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+            " text, role UNINDEXED, ts UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value)")
+        self._db.commit()
+        journal.index = self
+
+    # --- INDEXING ---
+
+    def add_turn(self, record, start, end):
+        """Indexes a turn the journal just wrote at bytes [start, end), if the index is caught up to it."""
+        try:
+            with self._lock:
+                if self._offset() != start:
+                    return  # sync() has not reached this point yet and will index the turn itself
+                self._insert(record)
+                self._set_offset(end)
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error updating search index: {e}")
+
+    def sync(self):
+        """Indexes every journal turn after the last indexed offset. Returns the number of turns added."""
+        added = 0
+        with self._lock:
+            if self._offset() > self.journal.end_offset():
+                self._reset()  # the journal was replaced or truncated
+        while True:
+            with self._lock:
+                batch = 0
+                offset = self._offset()
+                for offset, record in self.journal.iter_records(offset):
+                    self._insert(record)
+                    batch += 1
+                    if batch >= SYNC_BATCH_TURNS:
+                        break
+                self._set_offset(offset)
+                self._db.commit()
+            added += batch
+            if batch < SYNC_BATCH_TURNS:
+                return added
+
+    def on_compact(self, old_size, new_size, oldest_ts=None):
+        """Called by ChatJournal.compact() after the file was rewritten."""
+        try:
+            with self._lock:
+                if self._offset() != old_size:
+                    # Offsets into the old file are meaningless now; the next sync() re-indexes
+                    self._reset()
+                    return
+                if oldest_ts is not None:
+                    self._db.execute("DELETE FROM messages WHERE ts < ?", (oldest_ts,))
+                self._set_offset(new_size)
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error updating search index: {e}")
+
+    # --- QUERYING ---
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Returns up to `limit` SearchHits ranked by BM25, best first."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    "SELECT rowid, role, ts, snippet(messages, 0, '[', ']', '...', ?), bm25(messages)"
+                    " FROM messages WHERE messages MATCH ? ORDER BY rank LIMIT ?",
+                    (SNIPPET_TOKENS, expression, limit)
+                ).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [SearchHit(*row) for row in rows]
+
+    def message(self, rowid):
+        """Full text of a hit."""
+        with self._lock:
+            row = self._db.execute("SELECT text FROM messages WHERE rowid = ?", (rowid,)).fetchone()
+        return row[0] if row else ""
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        if self.journal.index is self:
+            self.journal.index = None
+
+    # --- INTERNALS ---
+
+    def _insert(self, record):
+        ts = record.get("ts")
+        self._db.executemany(
+            "INSERT INTO messages (text, role, ts) VALUES (?, ?, ?)",
+            [(message_text(message), message.get("role", ""), ts) for message in record["messages"]]
+        )
+
+    def _offset(self):
+        row = self._db.execute("SELECT value FROM state WHERE key = 'offset'").fetchone()
+        return row[0] if row else 0
+
+    def _set_offset(self, offset):
+        self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('offset', ?)", (offset,))
+
+    def _reset(self):
+        self._db.execute("DELETE FROM messages")
+        self._set_offset(0)
+        self._db.commit()
@@ -0,0 +1,192 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from PIL import Image
+
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Display sizes kept next to each original; each level is built from the one above it
+THUMBNAIL_WIDTHS = (500, 250, 125)
+INDEX_FILE_NAME = "index.json"
+# Access times alone are written back at most this often (and by flush())
+INDEX_SAVE_INTERVAL_SECONDS = 5.0
+
+
+def fast_downscale(img, width):
+    """
+    Scales `img` to `width` pixels wide. JPEG decoding is first cut down with
+    Image.draft and large ratios are pre-shrunk with Image.reduce, so the final
+    LANCZOS pass only runs over a small image.
+    """
+    if img.width <= width:
+        return img.copy()
+    height = max(1, round(width * img.height / img.width))
+    img.draft("RGB", (width, height))
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    factor = min(img.width // (width * 2), img.height // (height * 2))
+    if factor > 1:
+        img = img.reduce(factor)
+    return img.resize((width, height), Image.Resampling.LANCZOS)
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache for generated images.
+
+    Originals are stored under their SHA-256 with a URL -> hash map on top, so
+    a replayed URL is served without touching the network and identical images
+    are stored once. Each entry also keeps a small pyramid of display
+    thumbnails. Entries are evicted least-recently-used first once the cache
+    grows beyond `max_bytes`.
+
+    Decoding, scaling and file writes run outside the lock, so parallel loads
+    do not wait on each other; the lock only guards the index. New entries
+    and evictions save the index right away, while access-time updates are
+    batched (call flush() before exiting).
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    # --- PUBLIC API ---
+
+    def fetch(self, url, download):
+        """
+        Returns the content hash for `url`, calling `download(url) -> bytes` only on a miss.
+        """
+        with self._lock:
+            key = self._index["urls"].get(url)
+            if key and os.path.exists(self.original_path(key)):
+                self._touch(key)
+                return key
+
+        data = download(url)
+        return self.put(data, url=url)
+
+    def put(self, data, url=None):
+        """Stores raw image bytes (and the thumbnail pyramid) and returns their content hash."""
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            stored = key in self._index["entries"] and os.path.exists(self.original_path(key))
+            if stored:
+                if url and self._index["urls"].get(url) != key:
+                    self._index["urls"][url] = key
+                    self._dirty = True
+                self._touch(key)
+                return key
+
+        # Content-addressed, so a concurrent put of the same image writes identical files
+        img = Image.open(io.BytesIO(data))
+        ext = "." + (img.format or "png").lower()
+        self._write_file(os.path.join(self.directory, key[:2], key + ext), data)
+        size = len(data) + self._build_thumbnails(key, img)
+
+        with self._lock:
+            self._index["entries"][key] = {"ext": ext, "size": size, "atime": time.time()}
+            if url:
+                self._index["urls"][url] = key
+            self._evict()
+            self._save_index()
+        return key
+
+    def flush(self):
+        """Writes batched access-time updates to the index."""
+        with self._lock:
+            if self._dirty:
+                self._save_index()
+
+    def thumbnail(self, key, width):
+        """Returns a PIL image of the entry at the smallest cached width >= `width`, scaled to `width`."""
+        with self._lock:
+            self._touch(key)
+        for level in sorted(THUMBNAIL_WIDTHS):
+            if level >= width and os.path.exists(self._thumbnail_path(key, level)):
+                img = Image.open(self._thumbnail_path(key, level))
+                return img if img.width <= width else fast_downscale(img, width)
+        return fast_downscale(Image.open(self.original_path(key)), width)
+
+    def original_path(self, key):
+        entry = self._index["entries"].get(key, {})
+        return os.path.join(self.directory, key[:2], key + entry.get("ext", ".png"))
+
+    def extension(self, key):
+        return self._index["entries"].get(key, {}).get("ext", ".png")
+
+    # --- INTERNALS ---
+
+    def _thumbnail_path(self, key, width):
+        return os.path.join(self.directory, key[:2], f"{key}_{width}.png")
+
+    def _build_thumbnails(self, key, img):
+        """Writes the thumbnail pyramid, each level downscaled from the previous one. Returns bytes written."""
+        written = 0
+        source = img
+        for width in THUMBNAIL_WIDTHS:
+            if source.width <= width:
+                continue
+            source = fast_downscale(source, width)
+            buffer = io.BytesIO()
+            source.save(buffer, format="PNG")
+            self._write_file(self._thumbnail_path(key, width), buffer.getvalue())
+            written += buffer.tell()
+        return written
+
+    def _touch(self, key):
+        entry = self._index["entries"].get(key)
+        if entry is not None:
+            entry["atime"] = time.time()
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= INDEX_SAVE_INTERVAL_SECONDS:
+                self._save_index()
+
+    def _evict(self):
+        entries = self._index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["atime"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]["size"]
+            for path in [self.original_path(key)] + [self._thumbnail_path(key, w) for w in THUMBNAIL_WIDTHS]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del entries[key]
+            self._index["urls"] = {u: k for u, k in self._index["urls"].items() if k != key}
+
+    def _write_file(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per-thread temporary name: two threads may write the same content-addressed file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE_NAME), "r") as f:
+                index = json.load(f)
+            if isinstance(index.get("urls"), dict) and isinstance(index.get("entries"), dict):
+                return index
+        except (OSError, json.JSONDecodeError, AttributeError):
+            pass
+        return {"urls": {}, "entries": {}}
+
+    def _save_index(self):
+        self._write_file(
+            os.path.join(self.directory, INDEX_FILE_NAME),
+            json.dumps(self._index, separators=(",", ":")).encode("utf-8"),
+        )
+        self._dirty = False
+        self._saved_at = time.monotonic()
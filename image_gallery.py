@@ -0,0 +1,88 @@
+import tkinter as tk
+
+import customtkinter as ctk
+
+# Thumbnail width in the strip; matches a level of the image cache's thumbnail pyramid
+GALLERY_THUMB_WIDTH = 250
+GALLERY_MAX_ITEMS = 48
+CAPTION_CHARS = 40
+
+
+class ImageGallery:
+    """
+    Horizontally scrolling strip of generated-image thumbnails, shown under
+    the transcript instead of replacing it.
+
+    A slot is added as a placeholder when a download starts and filled in when
+    its image is ready, so images appear one by one in whatever order they
+    finish. Only Tk calls happen here: images arrive already decoded and
+    scaled. Beyond `max_items` the oldest slots are dropped.
+
+    `on_open(key)` is called when a thumbnail is clicked and `on_save()` by
+    the save button.
+    """
+
+    def __init__(self, master, on_open=None, on_save=None, max_items=GALLERY_MAX_ITEMS):
+        self.on_open = on_open
+        self.max_items = max_items
+        self._slots = {}    # slot id -> {"frame", "label", "key", "image"}
+        self._order = []    # slot ids, oldest first
+
+        self.frame = ctk.CTkFrame(master, border_width=2)
+        header = ctk.CTkFrame(self.frame, fg_color="transparent")
+        header.pack(side=tk.TOP, fill=tk.X, padx=5, pady=(5, 0))
+        self.title_label = ctk.CTkLabel(header, text="", font=('Arial', 12, 'bold'))
+        self.title_label.pack(side=tk.LEFT)
+        self.hide_button = ctk.CTkButton(header, text="Hide", command=self.hide, font=('Arial', 12), width=60)
+        self.hide_button.pack(side=tk.RIGHT)
+        self.save_button = ctk.CTkButton(header, text="সব ছবি ডাউনলোড করুন", command=on_save, font=('Arial', 12))
+        self.save_button.pack(side=tk.RIGHT, padx=(0, 5))
+
+        self.strip = ctk.CTkScrollableFrame(self.frame, orientation="horizontal", height=GALLERY_THUMB_WIDTH + 30)
+        self.strip.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+    def show(self):
+        self.frame.grid()
+
+    def hide(self):
+        self.frame.grid_remove()
+
+    def add_slot(self, slot_id, caption):
+        """Adds a placeholder at the end of the strip and scrolls to it."""
+        frame = ctk.CTkFrame(self.strip, fg_color="transparent")
+        frame.pack(side=tk.LEFT, padx=5)
+        label = ctk.CTkLabel(frame, text="...", width=GALLERY_THUMB_WIDTH, height=GALLERY_THUMB_WIDTH)
+        label.pack(side=tk.TOP)
+        short = caption if len(caption) <= CAPTION_CHARS else caption[:CAPTION_CHARS - 3] + "..."
+        ctk.CTkLabel(frame, text=short, font=('Arial', 10), text_color='gray').pack(side=tk.TOP)
+        self._slots[slot_id] = {"frame": frame, "label": label, "key": None, "image": None}
+        self._order.append(slot_id)
+        while len(self._order) > self.max_items:
+            self._slots.pop(self._order.pop(0))["frame"].destroy()
+        self._update_title()
+        self.show()
+        canvas = getattr(self.strip, "_parent_canvas", None)
+        if canvas is not None:
+            self.strip.after_idle(lambda: canvas.xview_moveto(1.0))
+
+    def fill(self, slot_id, ctk_image, key):
+        slot = self._slots.get(slot_id)
+        if slot is None:
+            return  # dropped while its image was loading
+        slot["key"] = key
+        slot["image"] = ctk_image  # keeps the image alive while it is displayed
+        slot["label"].configure(image=ctk_image, text="", cursor="hand2")
+        slot["label"].bind("<Button-1>", lambda event: self.on_open and self.on_open(key))
+        self._update_title()
+
+    def fail(self, slot_id, message):
+        slot = self._slots.get(slot_id)
+        if slot is not None:
+            slot["label"].configure(text=message, wraplength=GALLERY_THUMB_WIDTH - 20, text_color='#DC143C')
+
+    def keys(self):
+        """Cache keys of the loaded images, oldest first."""
+        return [self._slots[slot_id]["key"] for slot_id in self._order if self._slots[slot_id]["key"]]
+
+    def _update_title(self):
+        self.title_label.configure(text=f"Generated images: {len(self.keys())} of {len(self._order)} loaded")
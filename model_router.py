@@ -0,0 +1,184 @@
+import json
+import re
+import time
+from collections import namedtuple
+
+from chat_engine import MODEL_AUTO, MODEL_FLASH, MODEL_PRO
+from context_window import estimate_tokens
+
+EWMA_ALPHA = 0.3
+# Prompts scoring at least this many points go to the strong model
+STRONG_SCORE = 2
+LONG_PROMPT_TOKENS = 300
+LONG_HISTORY_TOKENS = 8000
+SHORT_PROMPT_TOKENS = 12
+# Above this recent error rate a model is avoided if the other one is healthier
+MAX_ERROR_RATE = 0.5
+# Health older than this no longer overrides routing, so an avoided model gets retried
+HEALTH_TTL_S = 120
+
+CODE_PATTERN = re.compile(
+    r"```|^\s*(def|class|import|from|function|const|let|var|public|private|#include)\b|[{};]\s*$|=>|\w+\(.*\)\s*[:{]",
+    re.MULTILINE
+)
+MATH_PATTERN = re.compile(
+    r"\\(frac|sum|int|sqrt|lim)|\b(prove|proof|integral|derivative|equation|theorem|matrix|probability)\b"
+    r"|\d\s*[\^*/=]\s*\d|[∑∫√π≤≥≠]",
+    re.IGNORECASE
+)
+HARD_PATTERN = re.compile(
+    r"\b(step[- ]by[- ]step|explain why|analy[sz]e|compare|design|architect|refactor|debug|optimi[sz]e|trade-?offs?)\b",
+    re.IGNORECASE
+)
+
+# model: model that serves the turn; reason: why; features: prompt features used;
+# hedge_model/hedge_after: start hedge_model if `model` has not produced a chunk after hedge_after seconds
+RouteDecision = namedtuple("RouteDecision", ["model", "reason", "features", "hedge_model", "hedge_after"])
+
+
+def prompt_features(prompt, history_tokens):
+    return {
+        "prompt_tokens": estimate_tokens(prompt),
+        "history_tokens": history_tokens,
+        "code": bool(CODE_PATTERN.search(prompt)),
+        "math": bool(MATH_PATTERN.search(prompt)),
+        "hard_words": len(HARD_PATTERN.findall(prompt)),
+    }
+
+
+def difficulty_score(features):
+    score = 0
+    if features["code"]:
+        score += 2
+    if features["math"]:
+        score += 2
+    score += min(features["hard_words"], 2)
+    if features["prompt_tokens"] > LONG_PROMPT_TOKENS:
+        score += 1
+    if features["history_tokens"] > LONG_HISTORY_TOKENS:
+        score += 1
+    if features["prompt_tokens"] < SHORT_PROMPT_TOKENS and not (features["code"] or features["math"]):
+        score -= 1
+    return score
+
+
+def build_router(model_name, args):
+    """The ModelRouter for `-m auto` from the front ends' --slo/--hedge-after/--route-log, or None for a fixed model."""
+    if model_name != MODEL_AUTO:
+        return None
+    return ModelRouter(MODEL_FLASH, MODEL_PRO, args.slo, args.hedge_after, args.route_log)
+
+
+class ModelHealth:
+    """EWMA of turn latency, time to first chunk and error rate for one model."""
+
+    def __init__(self):
+        self.turn_s = None
+        self.ttft_s = None
+        self.error_rate = 0.0
+        self.turns = 0
+        self.observed_at = None
+
+    def observe(self, ok, turn_s=None, ttft_s=None):
+        self.turns += 1
+        self.observed_at = time.monotonic()
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok and turn_s is not None:
+            self.turn_s = turn_s if self.turn_s is None else self.turn_s + EWMA_ALPHA * (turn_s - self.turn_s)
+        if ok and ttft_s is not None:
+            self.ttft_s = ttft_s if self.ttft_s is None else self.ttft_s + EWMA_ALPHA * (ttft_s - self.ttft_s)
+
+    def fresh(self):
+        return self.observed_at is not None and time.monotonic() - self.observed_at < HEALTH_TTL_S
+
+
+class ModelRouter:
+    """
+    Picks the model for each turn of the `auto` mode.
+
+    Prompts with code, math, "hard" wording, or a long prompt or history go to
+    `strong_model`; the rest go to `fast_model`. The choice is then checked
+    against recent health: a model with a high error rate is avoided, and with
+    `slo` (seconds) the strong model is skipped while its recent turn latency
+    exceeds the target. Health older than HEALTH_TTL_S is ignored, so an
+    avoided model is tried again after a while. With `hedge_after` (seconds),
+    a strong-model turn that has not produced a chunk by then is raced
+    against the fast model.
+    Decisions and their outcomes are appended to `log_path` (JSONL).
+    """
+
+    def __init__(self, fast_model, strong_model, slo=None, hedge_after=None, log_path=None):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.slo = slo
+        self.hedge_after = hedge_after
+        self.log_path = log_path
+        self.health = {fast_model: ModelHealth(), strong_model: ModelHealth()}
+
+    def route(self, prompt, history_tokens=0):
+        features = prompt_features(prompt, history_tokens)
+        features["score"] = difficulty_score(features)
+        if features["score"] >= STRONG_SCORE:
+            model, other, reason = self.strong_model, self.fast_model, "difficulty"
+        else:
+            model, other, reason = self.fast_model, self.strong_model, "simple"
+
+        health = self.health[model]
+        if health.fresh() and health.error_rate > MAX_ERROR_RATE and self.health[other].error_rate < health.error_rate:
+            model, other, reason = other, model, "errors"
+        elif model == self.strong_model and self._misses_slo(model) and not self._misses_slo(other):
+            model, other, reason = other, model, "slo"
+
+        hedge_model = None
+        if model == self.strong_model and self.hedge_after is not None:
+            hedge_model = self.fast_model
+        return RouteDecision(model, reason, features, hedge_model, self.hedge_after if hedge_model else None)
+
+    def alternative(self, model):
+        return self.fast_model if model == self.strong_model else self.strong_model
+
+    def record(self, decision, served_by, status, record, session_id=None, hedged=False):
+        """Feeds the outcome of a routed turn (a TurnTimer record) back into the health stats."""
+        ok = status != "error"
+        turn_ms = record.get("turn_ms")
+        ttft_ms = record.get("ttft_ms")
+        if status != "cache_hit":
+            self.health[served_by].observe(
+                ok,
+                turn_s=turn_ms / 1000 if turn_ms is not None and status == "ok" else None,
+                ttft_s=ttft_ms / 1000 if ttft_ms is not None else None
+            )
+        if self.log_path:
+            entry = {
+                "ts": time.time(),
+                "session": session_id,
+                "model": decision.model,
+                "reason": decision.reason,
+                "features": decision.features,
+                "hedged": hedged,
+                "served_by": served_by,
+                "status": status,
+                "ttft_ms": ttft_ms,
+                "turn_ms": turn_ms,
+                "slo_s": self.slo,
+            }
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"Error writing routing log: {e}")
+
+    def summary(self):
+        lines = ["--- Model Router ---"]
+        for model, health in self.health.items():
+            latency = f"{health.turn_s:.2f}s" if health.turn_s is not None else "n/a"
+            ttft = f"{health.ttft_s:.2f}s" if health.ttft_s is not None else "n/a"
+            lines.append(
+                f"{model}: {health.turns} turns, latency {latency}, first chunk {ttft}, "
+                f"error rate {health.error_rate:.0%}"
+            )
+        return "\n".join(lines)
+
+    def _misses_slo(self, model):
+        health = self.health[model]
+        return self.slo is not None and health.fresh() and health.turn_s is not None and health.turn_s > self.slo
@@ -0,0 +1,128 @@
+import contextlib
+import json
+import os
+import sys
+
+from retry_policy import is_retryable
+
+PIPE_READ_BYTES = 65536
+
+
+def read_pipe_prompts(stream, null_delimited=False):
+    """
+    Yields prompts from a binary stream as soon as each one is complete: one
+    per line, or NUL-terminated (so prompts may span lines). Blank prompts
+    are skipped; a final prompt without a delimiter is yielded at EOF.
+    """
+    delimiter = b"\0" if null_delimited else b"\n"
+    pending = b""
+    while True:
+        # read1 returns whatever has arrived instead of waiting for a full buffer
+        data = stream.read1(PIPE_READ_BYTES)
+        if not data:
+            break
+        pending += data
+        *complete, pending = pending.split(delimiter)
+        for raw in complete:
+            prompt = _decode_prompt(raw, null_delimited)
+            if prompt:
+                yield prompt
+    prompt = _decode_prompt(pending, null_delimited)
+    if prompt:
+        yield prompt
+
+
+def _decode_prompt(raw, null_delimited):
+    text = raw.decode("utf-8", errors="replace")
+    if not null_delimited:
+        text = text.rstrip("\r")
+    return text if text.strip() else None
+
+
+class PipeRunner:
+    """
+    Answers prompts read from stdin through a GeminiChat's ChatEngine, for
+    shell pipelines.
+
+    All prompts share one session, so they form a conversation; with -f
+    the turns are journaled and the next run resumes them. By default each
+    answer is written to stdout as raw text as it streams, followed by the
+    prompt delimiter (newline, or NUL with `null_delimited`). With `ndjson`
+    every event is one JSON object per line instead:
+        {"type": "chunk", "turn": n, "text": ...}
+        {"type": "image_request", "turn": n, "prompt": ...}
+        {"type": "images", "turn": n, "uris": [...]}
+        {"type": "done", "turn": n, "text": ..., "cancelled": bool}
+        {"type": "usage", "turn": n, "prompt_tokens": ..., "output_tokens": ..., "total_tokens": ...}
+        {"type": "error", "turn": n, "message": ..., "retryable": bool}
+    Everything else the program prints goes to stderr.
+    """
+
+    def __init__(self, chat, null_delimited=False, ndjson=False):
+        self.chat = chat
+        self.engine = chat.engine
+        self.session = chat.session
+        self.null_delimited = null_delimited
+        self.ndjson = ndjson
+        self.out = sys.stdout
+        self.turns = 0
+        self.failures = 0
+
+    def run(self, loop, stdin=None):
+        """Runs until EOF on stdin. Returns the process exit status (1 if any turn failed)."""
+        stdin = stdin if stdin is not None else sys.stdin.buffer
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                for prompt in read_pipe_prompts(stdin, self.null_delimited):
+                    self.chat._run_interruptible(loop, self.turn(prompt))
+            except KeyboardInterrupt:
+                pass
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`); silence the flush at interpreter exit
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, self.out.fileno())
+                return 1
+        return 1 if self.failures else 0
+
+    async def turn(self, prompt):
+        self.turns += 1
+        self.session.last_usage = None
+        try:
+            async for event in self.engine.stream_turn(prompt, session_id=self.session.session_id):
+                if event.kind == "text":
+                    self._emit("chunk", event.data, text=event.data)
+                elif event.kind == "image_request":
+                    self._emit("image_request", None, prompt=event.data)
+                elif event.kind == "images":
+                    self._emit("images", "".join(uri + "\n" for uri in event.data), uris=event.data)
+                elif event.kind in ("done", "cancelled"):
+                    self.chat._record_turn(prompt, event.data)
+                    self._emit("done", None, text=event.data, cancelled=event.kind == "cancelled")
+        except BrokenPipeError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self._emit("error", None, message=str(e), retryable=is_retryable(e))
+            print(f"Error: {e}")
+        else:
+            usage = self.session.last_usage
+            if usage is not None:
+                self._emit(
+                    "usage", None,
+                    prompt_tokens=getattr(usage, "prompt_token_count", None),
+                    output_tokens=getattr(usage, "candidates_token_count", None),
+                    total_tokens=getattr(usage, "total_token_count", None)
+                )
+        if not self.ndjson:
+            self._write("\0" if self.null_delimited else "\n")
+
+    def _emit(self, kind, raw_text, **fields):
+        """Writes an event: as an NDJSON line, or (raw mode) just `raw_text`, if any."""
+        if self.ndjson:
+            self._write(json.dumps({"type": kind, "turn": self.turns, **fields}, ensure_ascii=False) + "\n")
+        elif raw_text:
+            self._write(raw_text)
+
+    def _write(self, text):
+        self.out.write(text)
+        self.out.flush()
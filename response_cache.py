@@ -0,0 +1,105 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+RESPONSE_CACHE_FILE = "response_cache.sqlite3"
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_MODES = ("off", "read", "readwrite")
+
+
+def cache_key(model_name, config, contents):
+    """Stable hash of everything that determines a response."""
+    canonical = json.dumps(
+        {"model": model_name, "config": config, "contents": contents},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Opt-in persistent cache of streamed responses, stored in SQLite.
+
+    Entries hold the original chunk list so a hit can be replayed through the
+    normal streaming path. Entries expire after `ttl` seconds and the least
+    recently used ones are evicted once the stored chunks exceed `max_bytes`.
+    With mode "read" the cache is consulted but never written.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_FILE, mode="readwrite",
+                 ttl=RESPONSE_CACHE_TTL_SECONDS, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, chunks TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    @property
+    def writable(self):
+        return self.mode == "readwrite"
+
+    def get(self, key):
+        """Returns the cached chunk list for `key`, or None on a miss (expired entries are misses)."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT chunks, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, chunks):
+        if not self.writable:
+            return
+        data = json.dumps(chunks, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, chunks, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
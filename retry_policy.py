@@ -0,0 +1,149 @@
+import asyncio
+import email.utils
+import random
+import re
+import time
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Exceptions from these packages (the HTTP stacks under genai) are connection-level failures
+TRANSPORT_MODULES = ("httpx", "httpcore", "aiohttp", "requests", "urllib3")
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20.0
+MAX_ATTEMPTS = 4
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+RETRY_DELAY_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s*$")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a model whose circuit breaker is open."""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"{model} is failing repeatedly; not retrying for {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """True for rate limits, server errors, dropped connections and open circuits."""
+    if isinstance(error, CircuitOpenError):
+        return True
+    if getattr(error, "code", None) in RETRY_STATUS_CODES:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return type(error).__module__.split(".")[0] in TRANSPORT_MODULES
+
+
+def retry_after(error):
+    """
+    Seconds the server asked us to wait, or None. Reads a Retry-After header
+    (seconds or HTTP date) from the error's response, or the RetryInfo detail
+    of a Google API error body ({"retryDelay": "17s"}).
+    """
+    value = getattr(error, "retry_after", None)
+    if value is not None:
+        return value
+
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    header = headers.get("retry-after") if headers is not None else None
+    if header:
+        header = header.strip()
+        if header.replace(".", "", 1).isdigit():
+            return float(header)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(header).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details).get("details")
+    for detail in details if isinstance(details, list) else []:
+        match = RETRY_DELAY_PATTERN.match(str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Full-jitter exponential backoff for the given (1-based) attempt."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker for one model. After `threshold` failures in a
+    row it opens for `reset_after` seconds; then one request at a time is let
+    through (half-open) until one succeeds and closes it again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    def retry_in(self):
+        """Seconds until a request may be sent (0 if the breaker lets requests through)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_after - time.monotonic())
+
+    def allow(self):
+        """Claims permission to send a request; a half-open breaker lets one trial through per period."""
+        if self.retry_in() > 0:
+            return False
+        if self.opened_at is not None:
+            # Re-arm the window so concurrent callers wait for this trial's outcome
+            self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """
+    Retry and circuit-breaker settings shared by every request of a ChatEngine.
+
+    A failed attempt waits for the server's Retry-After when it gives one, or
+    for a jittered exponential backoff otherwise. A requested wait longer
+    than `max_delay` is not slept through: the error is raised instead.
+    """
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BACKOFF_BASE_SECONDS, max_delay=BACKOFF_MAX_SECONDS,
+                 breaker_threshold=BREAKER_THRESHOLD, breaker_reset=BREAKER_RESET_SECONDS):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}
+
+    def breaker(self, model):
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def available(self, model):
+        return self.breaker(model).retry_in() == 0
+
+    def delay(self, attempt, error):
+        """Seconds to wait before retrying after `error`, or None if it should not be retried."""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        requested = retry_after(error)
+        if requested is None:
+            return backoff_delay(attempt, self.base_delay, self.max_delay)
+        if requested > self.max_delay:
+            return None
+        # Spread out clients that were all told the same Retry-After
+        return requested + random.uniform(0, self.base_delay)
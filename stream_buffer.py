@@ -0,0 +1,45 @@
+import time
+from collections import deque
+
+# The UI drains streamed text at most this often (~60 Hz)
+STREAM_TICK_MS = 16
+
+
+class StreamBuffer:
+    """
+    Hand-off point between the API worker thread and the Tk main loop.
+
+    The worker appends chunks without touching Tk; a single periodic UI tick
+    drains everything that arrived since the last tick and inserts it in one
+    operation, so the event queue holds one pending callback per stream
+    instead of one per chunk. deque.append/popleft are thread-safe, so no
+    lock is shared with the UI thread.
+
+    `last_lag` is how long the oldest chunk of the last non-empty drain
+    waited in the buffer (the UI-dispatch lag), in seconds.
+    """
+
+    def __init__(self):
+        self._pending = deque()
+        self._oldest = None
+        self.last_lag = 0.0
+
+    def append(self, text):
+        """Called from the worker thread for every streamed chunk."""
+        if self._oldest is None:
+            self._oldest = time.perf_counter()
+        self._pending.append(text)
+
+    def drain(self):
+        """Called on the UI thread; returns all pending text joined, or '' if there is none."""
+        oldest, self._oldest = self._oldest, None
+        if oldest is not None:
+            self.last_lag = time.perf_counter() - oldest
+        parts = []
+        pending = self._pending
+        while pending:
+            parts.append(pending.popleft())
+        return "".join(parts)
+
+    def __len__(self):
+        return len(self._pending)
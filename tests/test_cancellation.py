@@ -0,0 +1,87 @@
+"""
+Stopping a turn: once cancel() is called no further chunks are read from
+the upstream stream, and a turn stopped before it started sends nothing.
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from chat_engine import ChatEngine, MODEL_FLASH, TRUNCATED_MARKER, build_config
+from fake_gemini import FakeGeminiClient, FakeProfile
+
+
+def slow_stream():
+    """50 chunks at 20 per second: a turn takes about 2.5s unless it is stopped."""
+    return FakeProfile(ttft_s=0, chunk_chars=10, chunks_per_s=20, response_chars=500)
+
+
+class CancellationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeGeminiClient(slow_stream())
+        self.engine = ChatEngine(self.client, MODEL_FLASH, build_config(0.5))
+
+    def test_no_chunks_are_read_after_cancel(self):
+        chunks_at_cancel = []
+
+        def stop():
+            chunks_at_cancel.append(self.client.stats.chunks)
+            self.engine.cancel()
+
+        async def scenario():
+            events = []
+            async for event in self.engine.stream_turn("tell me a long story"):
+                events.append(event)
+                if event.kind == "text" and len(events) == 3:
+                    # Cancel from another callback while the stream waits, as the GUI's Stop button does
+                    asyncio.get_running_loop().call_later(0.01, stop)
+            await asyncio.sleep(0.3)  # several chunk intervals
+            return events
+
+        events = asyncio.run(scenario())
+        self.assertEqual(events[-1].kind, "cancelled")
+        self.assertTrue(events[-1].data.endswith(TRUNCATED_MARKER))
+        self.assertEqual(self.client.stats.chunks, chunks_at_cancel[0])
+        self.assertLess(self.client.stats.chunks, 10)
+        history = self.engine.session().history
+        self.assertEqual([message["role"] for message in history], ["user", "model"])
+
+    def test_cancel_while_waiting_for_the_session_sends_nothing(self):
+        async def scenario():
+            session = self.engine.session()
+            session.lock = asyncio.Lock()
+            await session.lock.acquire()  # stands in for a turn that is still finishing
+            turn = asyncio.create_task(self._collect("hello"))
+            await asyncio.sleep(0)
+            self.assertTrue(self.engine.is_busy())
+            self.engine.cancel()
+            session.lock.release()
+            return await turn
+
+        events = asyncio.run(scenario())
+        self.assertEqual([event.kind for event in events], ["cancelled"])
+        self.assertEqual(self.client.stats.requests, 0)
+
+    def test_cancel_with_no_turn_does_not_affect_the_next_one(self):
+        self.client.profile.chunks_per_s = 0
+
+        async def scenario():
+            self.engine.session()
+            self.engine.cancel()
+            return await self._collect("hello")
+
+        events = asyncio.run(scenario())
+        self.assertEqual(events[-1].kind, "done")
+        self.assertEqual(self.client.stats.requests, 1)
+
+    async def _collect(self, prompt):
+        return [event async for event in self.engine.stream_turn(prompt)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_journal import ChatJournal
+from history_search import HistorySearch
+
+
+def turn(i):
+    return [{"role": "user", "parts": [{"text": f"question {i}"}]},
+            {"role": "model", "parts": [{"text": f"answer {i}"}]}]
+
+
+class ChatJournalCompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "chat_history.jsonl")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_compact_leaves_a_clean_journal_alone(self):
+        journal = ChatJournal(self.path)
+        for i in range(3):
+            journal.append_turn(turn(i))
+        before = os.stat(self.path)
+        self.assertFalse(journal.compact())
+        self.assertEqual(os.stat(self.path).st_ino, before.st_ino)
+
+    def test_appends_compact_periodically_down_to_the_turn_limit(self):
+        journal = ChatJournal(self.path, compact_every=3, max_turns=2)
+        for i in range(6):
+            journal.append_turn(turn(i))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read().count(b"\n"), 2)
+        self.assertEqual(journal.read_tail(10)[1], turn(4) + turn(5))
+
+    def test_removed_bytes_moves_saved_offsets_back(self):
+        journal = ChatJournal(self.path, compact_every=0, max_turns=3)
+        for i in range(3):
+            journal.append_turn(turn(i))
+        cursor = journal.end_offset()  # everything before it was loaded earlier
+        for i in range(3, 5):
+            journal.append_turn(turn(i))
+        journal.compact()
+        cursor -= journal.removed_bytes
+        self.assertEqual(journal.read_tail(2, end=cursor)[1], turn(2))
+
+    def test_compact_drops_corrupt_lines_and_trims_in_binary(self):
+        journal = ChatJournal(self.path, max_turns=2)
+        journal.append_turn(turn(0))
+        with open(self.path, "ab") as f:
+            f.write(b"{not json\n")
+        for i in range(1, 4):
+            journal.append_turn(turn(i))
+        self.assertTrue(journal.compact())
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertNotIn(b"\r\n", data)
+        self.assertEqual(data.count(b"\n"), 2)
+        self.assertEqual(journal.read_tail(10)[1], turn(2) + turn(3))
+
+
+class ChatJournalReadOnlyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "chat_history.jsonl")
+        journal = ChatJournal(self.path)
+        journal.append_turn(turn(0))
+        with open(self.path, "ab") as f:
+            f.write(b'{"ts":1,"messages":[')  # a turn another process is still writing
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_read_only_open_keeps_a_torn_tail_and_refuses_writes(self):
+        with open(self.path, "rb") as f:
+            before = f.read()
+        journal = ChatJournal(self.path, read_only=True)
+        self.assertEqual(journal.read_tail(10)[1], turn(0))
+        with self.assertRaises(PermissionError):
+            journal.append_turn(turn(1))
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+    def test_search_over_a_read_only_journal(self):
+        search = HistorySearch(ChatJournal(self.path, read_only=True))
+        try:
+            search.sync()
+            hits = search.search("answer")
+            self.assertEqual([hit.role for hit in hits], ["model"])
+        finally:
+            search.close()
+        with open(self.path, "rb") as f:
+            self.assertTrue(f.read().endswith(b'"messages":['))
+
+
+if __name__ == "__main__":
+    unittest.main()
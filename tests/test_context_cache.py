@@ -0,0 +1,135 @@
+"""
+Context caching: the cached prefix is sent by reference instead of being
+re-sent, and only an "unsupported" client error turns caching off.
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from chat_engine import ChatEngine, MODEL_FLASH, build_config, text_message
+from context_cache import ContextCache
+from fake_gemini import FakeAPIError, FakeGeminiClient, FakeProfile
+
+FAST = dict(ttft_s=0, chunks_per_s=0, response_chars=200)
+
+
+def long_history(turns, chars=2000):
+    history = []
+    for i in range(turns):
+        history.append(text_message("user", f"question {i} " + "x" * chars))
+        history.append(text_message("model", f"answer {i} " + "y" * chars))
+    return history
+
+
+class EngineContextCacheTest(unittest.TestCase):
+
+    def test_cached_prefix_is_not_resent(self):
+        client = FakeGeminiClient(FakeProfile(**FAST))
+        history = long_history(4)
+        engine = ChatEngine(client, MODEL_FLASH, build_config(0.5), context_caching=True)
+        engine.session(history=list(history))
+
+        async def conversation():
+            for prompt in ("first follow-up", "second follow-up"):
+                [event async for event in engine.stream_turn(prompt)]
+        asyncio.run(conversation())
+
+        self.assertEqual(client.stats.caches_created, 1)
+        [cached_prefix] = client.cached.values()
+        self.assertEqual(cached_prefix, history)
+        for request in client.sent:
+            self.assertIn("cached_content", request["config"])
+            self.assertNotIn("system_instruction", request["config"])
+            for message in history:
+                self.assertNotIn(message, request["contents"])
+        self.assertEqual(client.sent[0]["contents"], [text_message("user", "first follow-up")])
+        self.assertEqual(len(client.sent[1]["contents"]), 3)
+
+    def test_summarized_context_is_cached_once(self):
+        client = FakeGeminiClient(FakeProfile(**FAST))
+        engine = ChatEngine(
+            client, MODEL_FLASH, build_config(0.5, "You are a terse assistant."),
+            max_context_tokens=6000, context_caching=True
+        )
+        engine.session(history=long_history(20))
+
+        async def conversation():
+            for i in range(6):
+                [event async for event in engine.stream_turn(f"follow-up {i}")]
+        asyncio.run(conversation())
+
+        self.assertEqual(client.stats.caches_created, 1)
+        [cached_prefix] = client.cached.values()
+        self.assertTrue(cached_prefix[0]["parts"][0]["text"].startswith("[Summary of earlier conversation]"))
+        for request in client.sent:
+            self.assertIn("cached_content", request["config"])
+
+
+class ContextCacheRebuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeGeminiClient(FakeProfile(**FAST))
+        self.config = build_config(0.5)
+
+    def prepare(self, cache, history):
+        contents = history + [text_message("user", "next question")]
+        return asyncio.run(cache.prepare(contents, self.config))
+
+    def fail_next_create(self, error):
+        create = self.client.aio.caches.create
+
+        async def failing_create(model, config=None):
+            self.client.aio.caches.create = create
+            raise error
+        self.client.aio.caches.create = failing_create
+
+    def test_small_prefix_is_sent_inline_until_it_grows(self):
+        cache = ContextCache(self.client, MODEL_FLASH, min_tokens=1500)
+        contents, config = self.prepare(cache, long_history(1))
+        self.assertEqual(len(contents), 3)
+        self.assertNotIn("cached_content", config)
+        self.assertEqual(self.client.stats.caches_created, 0)
+
+        contents, config = self.prepare(cache, long_history(2))
+        self.assertEqual(len(contents), 1)
+        self.assertIn("cached_content", config)
+
+    def test_server_minimum_defers_caching_without_disabling_it(self):
+        self.client.profile.cache_min_tokens = 1500
+        cache = ContextCache(self.client, MODEL_FLASH, min_tokens=1)
+        contents, config = self.prepare(cache, long_history(1))
+        self.assertTrue(cache.supported)
+        self.assertNotIn("cached_content", config)
+        self.assertGreater(cache.min_tokens, 1)
+
+        contents, config = self.prepare(cache, long_history(2))
+        self.assertIn("cached_content", config)
+
+    def test_transient_errors_are_retried_next_turn(self):
+        cache = ContextCache(self.client, MODEL_FLASH, min_tokens=1)
+        self.fail_next_create(FakeAPIError(503))
+        _, config = self.prepare(cache, long_history(1))
+        self.assertTrue(cache.supported)
+        self.assertNotIn("cached_content", config)
+
+        _, config = self.prepare(cache, long_history(1))
+        self.assertIn("cached_content", config)
+
+    def test_unsupported_model_disables_caching(self):
+        cache = ContextCache(self.client, MODEL_FLASH, min_tokens=1)
+        self.fail_next_create(FakeAPIError(400, "Model does not support cached content"))
+        self.prepare(cache, long_history(1))
+        self.assertFalse(cache.supported)
+
+        _, config = self.prepare(cache, long_history(1))
+        self.assertNotIn("cached_content", config)
+        self.assertEqual(self.client.stats.caches_created, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
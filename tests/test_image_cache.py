@@ -0,0 +1,80 @@
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_gemini import png_bytes
+
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+
+@unittest.skipUnless(PIL_AVAILABLE, "Pillow not installed")
+class ImageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        from image_cache import ImageCache
+        self.workdir = tempfile.TemporaryDirectory()
+        self.cache = ImageCache(self.workdir.name)
+        self.saves = 0
+        save_index = self.cache._save_index
+
+        def counting_save():
+            self.saves += 1
+            save_index()
+        self.cache._save_index = counting_save
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_puts_do_not_wait_for_each_other_while_scaling(self):
+        build_thumbnails = self.cache._build_thumbnails
+        first_building = threading.Event()
+        release_first = threading.Event()
+
+        def slow_first(key, img):
+            if not first_building.is_set():
+                first_building.set()
+                release_first.wait(10)
+            return build_thumbnails(key, img)
+        self.cache._build_thumbnails = slow_first
+
+        keys = []
+        first = threading.Thread(target=lambda: keys.append(self.cache.put(png_bytes(600, 600, seed=1), url="u1")))
+        first.start()
+        self.assertTrue(first_building.wait(10))
+        # The first put is stuck scaling its image; a second one still completes
+        second = self.cache.put(png_bytes(600, 600, seed=2), url="u2")
+        release_first.set()
+        first.join(10)
+
+        self.assertEqual(len(set(keys + [second])), 2)
+        self.assertEqual(self.cache.fetch("u1", self.fail), keys[0])
+        self.assertEqual(self.cache.fetch("u2", self.fail), second)
+
+    def test_access_times_are_saved_in_batches(self):
+        from image_cache import ImageCache
+        key = self.cache.put(png_bytes(600, 600), url="u1")
+        self.assertEqual(self.saves, 1)
+        for _ in range(10):
+            self.cache.fetch("u1", self.fail)
+            self.cache.thumbnail(key, 250)
+        self.assertEqual(self.saves, 1)
+
+        self.cache.flush()
+        self.assertEqual(self.saves, 2)
+        self.cache.flush()
+        self.assertEqual(self.saves, 2)
+        self.assertEqual(ImageCache(self.workdir.name).fetch("u1", self.fail), key)
+
+    def fail(self, url):
+        raise AssertionError(f"{url} should have been served from the cache")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+One upstream request per turn: a text turn makes exactly one
+generate_content_stream call, and an image turn makes one
+generate_content_stream call plus one generate_images call.
+"""
+import asyncio
+import contextlib
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from chat_engine import ChatEngine, MODEL_FLASH, build_config
+from fake_gemini import FakeGeminiClient, FakeProfile
+
+GUI_AVAILABLE = all(importlib.util.find_spec(name) for name in ("customtkinter", "google", "PIL", "requests"))
+
+
+class FakeImageUrls:
+    def url_for(self, number):
+        return f"http://127.0.0.1:1/image/{number}.png"
+
+
+async def run_turn(engine, prompt):
+    return [event async for event in engine.stream_turn(prompt)]
+
+
+class EngineRequestCountTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeGeminiClient(FakeProfile(ttft_s=0, chunks_per_s=0, image_latency_s=0), image_server=FakeImageUrls())
+        self.engine = ChatEngine(self.client, MODEL_FLASH, build_config(0.5))
+
+    def test_text_turn_sends_one_request(self):
+        events = asyncio.run(run_turn(self.engine, "hello there"))
+        self.assertEqual(events[-1].kind, "done")
+        self.assertEqual(self.client.stats.requests, 1)
+        self.assertEqual(self.client.stats.image_requests, 0)
+
+    def test_image_turn_sends_one_request_and_one_image_call(self):
+        events = asyncio.run(run_turn(self.engine, "draw an image of a lighthouse"))
+        self.assertEqual([event.kind for event in events], ["image_request", "images", "done"])
+        self.assertEqual(self.client.stats.requests, 1)
+        self.assertEqual(self.client.stats.image_requests, 1)
+
+    def test_each_turn_of_a_conversation_sends_one_request(self):
+        async def conversation():
+            for i in range(3):
+                await run_turn(self.engine, f"question {i}")
+        asyncio.run(conversation())
+        self.assertEqual(self.client.stats.requests, 3)
+        self.assertEqual(len(self.engine.session().history), 6)
+
+
+@unittest.skipUnless(GUI_AVAILABLE, "GUI dependencies (customtkinter, google-genai, Pillow, requests) not installed")
+class GuiRequestCountTest(unittest.TestCase):
+    """The same check through the GUI's process_api_call, run headless."""
+
+    def setUp(self):
+        from bench_offline import HeadlessGui, NullWriter
+        self.workdir = tempfile.TemporaryDirectory()
+        self.client = FakeGeminiClient(FakeProfile(ttft_s=0, chunks_per_s=0, image_latency_s=0), image_server=FakeImageUrls())
+        with contextlib.redirect_stdout(NullWriter()):
+            self.app = HeadlessGui(self.client, self.workdir.name)
+
+    def tearDown(self):
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            self.app.close()
+        self.workdir.cleanup()
+
+    def test_text_turn_sends_one_request(self):
+        self.app.run_turn("hello there")
+        self.assertEqual(self.client.stats.requests, 1)
+
+    def test_image_turn_sends_one_request_and_one_image_call(self):
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            self.app.run_turn("draw an image of a lighthouse")
+        self.assertEqual(self.client.stats.requests, 1)
+        self.assertEqual(self.client.stats.image_requests, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
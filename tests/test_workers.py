@@ -0,0 +1,39 @@
+import importlib.util
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REQUESTS_AVAILABLE = importlib.util.find_spec("requests") is not None
+
+
+@unittest.skipUnless(REQUESTS_AVAILABLE, "requests not installed")
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_full_queue_is_refused(self):
+        from workers import WorkerPool
+        pool = WorkerPool(max_workers=1, max_queued=2)
+        release = threading.Event()
+        futures = [pool.submit(release.wait, 10) for _ in range(2)]
+        with self.assertRaises(RuntimeError):
+            pool.submit(release.wait, 10)
+        release.set()
+        for future in futures:
+            future.result(10)
+        self.assertEqual(pool.submit(lambda: 42).result(10), 42)
+        pool.shutdown(wait=True)
+
+    def test_submit_after_shutdown_gives_the_slot_back(self):
+        from workers import WorkerPool
+        pool = WorkerPool(max_workers=1, max_queued=1)
+        pool.shutdown(wait=True)
+        for _ in range(3):
+            with self.assertRaises(RuntimeError) as raised:
+                pool.submit(lambda: None)
+            self.assertNotIn("Too many pending jobs", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
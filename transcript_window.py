@@ -0,0 +1,156 @@
+import tkinter as tk
+
+MAX_RENDERED_BLOCKS = 200
+PAGE_SIZE = 20
+
+
+class TranscriptWindow:
+    """
+    Keeps the chat ScrolledText bounded to roughly the last `max_blocks` messages.
+
+    Each message is a block whose start is a Tk mark. When the user is following
+    the bottom of the conversation, blocks beyond the window are evicted from
+    the top; when the user scrolls to the top, evicted blocks (and then older
+    history from `load_older`) are paged back in above the current view.
+
+    `load_older(count)` must return a list of (tag, label, text) tuples older
+    than anything returned so far, oldest first, or [] when history is exhausted.
+
+    Complete messages added while a block is streaming are queued and
+    appended after it finishes.
+    """
+
+    def __init__(self, display, load_older=None, max_blocks=MAX_RENDERED_BLOCKS, page_size=PAGE_SIZE):
+        self.display = display
+        self.load_older = load_older
+        self.max_blocks = max_blocks
+        self.page_size = page_size
+
+        self._blocks = []        # [mark, (tag, label, text)] of rendered blocks, oldest first
+        self._evicted = []       # stack of (tag, label, text); the top is adjacent to the first block
+        self._history_exhausted = load_older is None
+        self._mark_counter = 0
+        self._paging = False
+        self._open = False
+        self._queued = []        # (tag, label, text) added while a block was open
+
+        self._scrollbar_set = display.vbar.set if hasattr(display, "vbar") else None
+        display.configure(yscrollcommand=self._on_scroll)
+
+    # --- APPENDING ---
+
+    def add_block(self, tag, label, text):
+        """Appends a complete message at the bottom, or after the streaming block once it finishes."""
+        if self._open:
+            self._queued.append((tag, label, text))
+            return
+        self.start_block(tag, label)
+        self.finish_block(text)
+
+    def start_block(self, tag, label):
+        """Starts a message at the bottom whose text will arrive through stream()."""
+        start = self.display.index("end-1c")
+        self.display.config(state='normal')
+        self.display.insert(tk.END, f"{label}: ", (tag,))
+        self.display.config(state='disabled')
+        self._blocks.append([self._new_mark(start), (tag, label, None)])
+        self._open = True
+        self.display.see(tk.END)
+
+    def stream(self, text):
+        self.display.config(state='normal')
+        self.display.insert(tk.END, text)
+        self.display.config(state='disabled')
+        self.display.see(tk.END)
+
+    def finish_block(self, text=None):
+        """
+        Closes the open block, if any. `text` replaces what was streamed when given;
+        either way the final text is kept so the block can be re-rendered after eviction.
+        """
+        if not self._open:
+            return
+        self._open = False
+        mark, (tag, label, _) = self._blocks[-1]
+        body_start = f"{mark} + {len(label) + 2}c"
+        rendered = self.display.get(body_start, "end-1c")
+        self.display.config(state='normal')
+        if text is None:
+            text = rendered
+        elif rendered != text:
+            self.display.delete(body_start, "end-1c")
+            self.display.insert(tk.END, text)
+        self._blocks[-1][1] = (tag, label, text)
+        self.display.insert(tk.END, "\n\n")
+        self.display.config(state='disabled')
+        self.display.see(tk.END)
+        self._trim()
+        queued, self._queued = self._queued, []
+        for record in queued:
+            self.add_block(*record)
+
+    # --- WINDOWING ---
+
+    def _on_scroll(self, first, last):
+        if self._scrollbar_set:
+            self._scrollbar_set(first, last)
+        first, last = float(first), float(last)
+        if first <= 0.0 and last < 1.0 and not self._paging:
+            self._paging = True
+            self.display.after_idle(self._page_in)
+        elif last >= 1.0 and len(self._blocks) > self.max_blocks:
+            self.display.after_idle(self._trim)
+
+    def _page_in(self):
+        try:
+            records = []
+            while self._evicted and len(records) < self.page_size:
+                records.append(self._evicted.pop())
+            records.reverse()
+            if not records and not self._history_exhausted:
+                records = self.load_older(self.page_size)
+                if not records:
+                    self._history_exhausted = True
+            if records:
+                self._prepend(records)
+        finally:
+            self._paging = False
+
+    def _prepend(self, records):
+        """Inserts `records` (oldest first) above the first block without moving the view."""
+        self.display.mark_set("view_top", "@0,0")
+        self.display.config(state='normal')
+        new_blocks = []
+        for tag, label, text in reversed(records):
+            self.display.insert("1.0", f"{label}: ", (tag,), (text or "") + "\n\n")
+            new_blocks.append([self._new_mark("1.0"), (tag, label, text)])
+        self.display.config(state='disabled')
+        new_blocks.reverse()
+        self._blocks[:0] = new_blocks
+        self.display.yview("view_top")
+
+    def _trim(self):
+        """Evicts the oldest blocks while the view is at the bottom and the window is over size."""
+        excess = len(self._blocks) - self.max_blocks
+        if excess <= 0 or self.display.yview()[1] < 1.0:
+            return
+        for _, record in self._blocks[:excess]:
+            self._evicted.append(record)
+        self._delete_blocks(excess)
+
+    def _delete_blocks(self, count):
+        if count <= 0:
+            return
+        end = self._blocks[count][0] if count < len(self._blocks) else "end-1c"
+        self.display.config(state='normal')
+        self.display.delete("1.0", end)
+        self.display.config(state='disabled')
+        for mark, _ in self._blocks[:count]:
+            self.display.mark_unset(mark)
+        del self._blocks[:count]
+
+    def _new_mark(self, index):
+        self._mark_counter += 1
+        mark = f"block{self._mark_counter}"
+        self.display.mark_set(mark, index)
+        return mark
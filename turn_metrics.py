@@ -0,0 +1,198 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Bucket upper bounds; values above the last bound land in an overflow bucket
+MS_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+BYTES_BOUNDS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+RATE_BOUNDS = (1, 5, 10, 25, 50, 100, 200, 400, 800)
+
+METRICS = {
+    # name: (unit, bounds, description)
+    "request_build_ms": ("ms", MS_BOUNDS, "Time to build the request (context selection, cache lookups)"),
+    "payload_bytes": ("bytes", BYTES_BOUNDS, "Size of the text contents sent per request"),
+    "ttft_ms": ("ms", MS_BOUNDS, "Time from sending the request to the first chunk"),
+    "inter_chunk_gap_ms": ("ms", MS_BOUNDS, "Gap between consecutive streamed chunks"),
+    "turn_ms": ("ms", MS_BOUNDS, "Total turn time"),
+    "tokens_per_second": ("tok/s", RATE_BOUNDS, "Output tokens per second of streaming"),
+    "ui_dispatch_lag_ms": ("ms", MS_BOUNDS, "Delay between a chunk arriving and the UI showing it"),
+    "history_save_ms": ("ms", MS_BOUNDS, "Time to persist a turn to the history journal"),
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) per observation, no samples kept."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation, capped at the observed max."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+
+class TurnTimer:
+    """Collects the timings of one turn and reports them to the registry as they happen."""
+
+    def __init__(self, registry, session_id, model_name):
+        self.registry = registry
+        self.record = {"session": session_id, "model": model_name}
+        self.started = time.perf_counter()
+        self.sent_at = None
+        self.first_chunk_at = None
+        self.last_chunk_at = None
+        self.chunks = 0
+
+    def request_sent(self, payload_bytes):
+        self.record["payload_bytes"] = payload_bytes
+        self.registry.observe("payload_bytes", payload_bytes)
+        if self.sent_at is not None:
+            return  # a retry: build time and time to first chunk count from the first request
+        self.sent_at = time.perf_counter()
+        build_ms = (self.sent_at - self.started) * 1000
+        self.record["request_build_ms"] = round(build_ms, 3)
+        self.registry.observe("request_build_ms", build_ms)
+
+    def chunk(self):
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+            ttft_ms = (now - (self.sent_at or self.started)) * 1000
+            self.record["ttft_ms"] = round(ttft_ms, 3)
+            self.registry.observe("ttft_ms", ttft_ms)
+        else:
+            self.registry.observe("inter_chunk_gap_ms", (now - self.last_chunk_at) * 1000)
+        self.last_chunk_at = now
+        self.chunks += 1
+
+    def finish(self, status, output_tokens=0):
+        now = time.perf_counter()
+        turn_ms = (now - self.started) * 1000
+        self.record.update(status=status, turn_ms=round(turn_ms, 3), chunks=self.chunks, output_tokens=output_tokens)
+        self.registry.observe("turn_ms", turn_ms)
+        if output_tokens and self.first_chunk_at is not None:
+            streaming_s = max(now - self.first_chunk_at, 1e-6)
+            rate = output_tokens / streaming_s
+            self.record["tokens_per_second"] = round(rate, 2)
+            self.registry.observe("tokens_per_second", rate)
+        self.registry.finish_turn(self.record)
+
+
+class MetricsRegistry:
+    """
+    In-memory latency histograms for the chat hot path.
+
+    report() renders the /stats table. With `export_path`, each finished turn
+    is appended as one JSON line (*.jsonl) or the full Prometheus text
+    exposition is rewritten (any other extension, e.g. *.prom).
+    """
+
+    def __init__(self, export_path=None):
+        self.export_path = export_path
+        self.histograms = {name: Histogram(bounds) for name, (_, bounds, _) in METRICS.items()}
+        self.statuses = {}
+        self.retries = 0  # requests re-sent after an error or a dropped stream
+        self._lock = threading.Lock()
+
+    def start_turn(self, session_id, model_name):
+        return TurnTimer(self, session_id, model_name)
+
+    def observe(self, name, value):
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def finish_turn(self, record):
+        with self._lock:
+            self.statuses[record["status"]] = self.statuses.get(record["status"], 0) + 1
+            self.retries += record.get("retries", 0)
+        if self.export_path:
+            try:
+                self._export(record)
+            except OSError as e:
+                print(f"Error exporting metrics: {e}")
+
+    def snapshot(self):
+        """Returns {"turns": {status: count}, "retries": n, metric: {count, avg, p50, p95, max}} for observed metrics."""
+        with self._lock:
+            result = {"turns": dict(self.statuses), "retries": self.retries}
+            for name, histogram in self.histograms.items():
+                if histogram.count:
+                    result[name] = {
+                        "count": histogram.count,
+                        "avg": round(histogram.total / histogram.count, 3),
+                        "p50": round(histogram.quantile(0.5), 3),
+                        "p95": round(histogram.quantile(0.95), 3),
+                        "max": round(histogram.max, 3),
+                    }
+        return result
+
+    def report(self):
+        snapshot = self.snapshot()
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(snapshot["turns"].items()))
+        lines = ["--- Turn Statistics ---"]
+        lines.append(
+            f"Turns: {sum(snapshot['turns'].values())} ({statuses or 'none yet'}), retried requests: {snapshot['retries']}"
+        )
+        lines.append(f"{'metric':<22}{'count':>7}{'avg':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+        for name, (unit, _, _) in METRICS.items():
+            if name not in snapshot:
+                continue
+            stats = snapshot[name]
+            lines.append(
+                f"{name:<22}{stats['count']:>7}{stats['avg']:>10.1f}{stats['p50']:>10.1f}"
+                f"{stats['p95']:>10.1f}{stats['max']:>10.1f}  {unit}"
+            )
+        return "\n".join(lines)
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            for name, (_, bounds, description) in METRICS.items():
+                histogram = self.histograms[name]
+                metric = f"gemini_chat_{name}"
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+            lines.append("# TYPE gemini_chat_turns_total counter")
+            for status, count in sorted(self.statuses.items()):
+                lines.append(f'gemini_chat_turns_total{{status="{status}"}} {count}')
+            lines.append("# TYPE gemini_chat_retries_total counter")
+            lines.append(f"gemini_chat_retries_total {self.retries}")
+        return "\n".join(lines) + "\n"
+
+    def _export(self, record):
+        if self.export_path.endswith(".jsonl"):
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(record, ts=time.time())) + "\n")
+        else:
+            tmp_path = self.export_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.export_path)
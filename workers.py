@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_WORKERS = 4
+MAX_QUEUED_JOBS = 64
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 8
+WAIT_SAMPLES = 1000
+
+
+class PoolMetrics:
+    """Thread-safe counters for the worker pool and the pooled HTTP session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.connections = 0
+        self.queue_waits = deque(maxlen=WAIT_SAMPLES)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.jobs += 1
+            self.queue_waits.append(seconds)
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def summary(self):
+        with self._lock:
+            waits = sorted(self.queue_waits)
+        if waits:
+            p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+            wait_info = f"queue wait avg {sum(waits) / len(waits) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms"
+        else:
+            wait_info = "queue wait n/a"
+        return f"{self.jobs} jobs, {wait_info}, {self.connections} HTTP connections opened"
+
+
+class WorkerPool:
+    """
+    Bounded ThreadPoolExecutor for background jobs such as image downloads.
+
+    Jobs run as soon as a worker is free. At most `max_queued` jobs may be
+    pending at once.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED_JOBS, metrics=None):
+        self.metrics = metrics or PoolMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-worker")
+        self._slots = threading.BoundedSemaphore(max_queued)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise RuntimeError("Too many pending jobs; try again when the current ones finish.")
+
+        future = Future()
+        try:
+            self._executor.submit(self._run, (future, fn, args, time.perf_counter()))
+        except BaseException:
+            # e.g. submitted after shutdown(): the job never runs, so give its slot back
+            self._slots.release()
+            raise
+        return future
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job):
+        future, fn, args, submitted_at = job
+        self.metrics.record_wait(time.perf_counter() - submitted_at)
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that reports every new TCP/TLS connection to PoolMetrics."""
+
+    def __init__(self, metrics, **kwargs):
+        self.metrics = metrics
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        manager = self.poolmanager
+        # Copy before patching: urllib3 shares the default mapping between pool managers
+        manager.pool_classes_by_scheme = {
+            scheme: self._counting_pool(pool_cls)
+            for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+        }
+
+    def _counting_pool(self, pool_cls):
+        metrics = self.metrics
+
+        def _new_conn(pool):
+            metrics.record_connection()
+            return pool_cls._new_conn(pool)
+
+        return type(pool_cls.__name__, (pool_cls,), {"_new_conn": _new_conn})
+
+
+def pooled_session(metrics=None, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """Returns a keep-alive requests.Session whose adapters count new connections into `metrics`."""
+    metrics = metrics or PoolMetrics()
+    session = requests.Session()
+    adapter = _CountingAdapter(metrics, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session